@@ -1,22 +1,92 @@
-from flask import Flask, request, render_template, send_file, jsonify
-import requests
+from flask import Flask, request, render_template, jsonify, Response
 import json
 import csv
 import io
 import re
 import os
-import threading
 import sys
+import time
+import hashlib
+import threading
 from collections import defaultdict
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from imx_client import get_client
+from job_queue import JobScheduler, QueueFullError
+from job_store import make_job_store
+from asset_store import get_asset_store
+from owner_index import get_owner_index
+import fast_aggregate
+import metrics
+import result_cache
+import report_formats
+from records import CardRecord
+from card_catalog import get_catalog, new_counter, counter_dict, GRADE_SLOTS, FOIL_OFFSET
+from query_plan import ReportQuery, pages_for, PAGE_SIZE
 
 # Ajouter le sous-dossier au chemin Python si nécessaire
 # sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'cta-to-csv'))
 
 app = Flask(__name__)
 
-# Dictionnaire pour stocker l'état de chaque requête
-request_status = {}
+# Registre de l'état de chaque requête (avec TTL et éviction LRU)
+# JOB_STORE_BACKEND=sqlite le partage entre tous les workers gunicorn
+request_status = make_job_store()
+
+# Pool de workers et file d'attente bornée pour les traitements
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', '100'))
+scheduler = JobScheduler(workers=JOB_WORKERS, max_queue=JOB_QUEUE_SIZE)
+
+# Jauges et compteurs calculés à chaque lecture de /metrics
+metrics.REGISTRY.gauge('jobs', "Tâches du worker par état", ('state',),
+                       callback=lambda: {state: scheduler.stats()[state] for state in ('queued', 'running')})
+metrics.REGISTRY.gauge('job_store_entries', "Entrées du registre de tâches",
+                       callback=lambda: request_status.stats()['entries'])
+metrics.REGISTRY.gauge('card_catalog_cards', "Cartes distinctes du catalogue",
+                       callback=lambda: len(get_catalog()))
+metrics.REGISTRY.gauge('job_store_bytes', "Taille des résultats conservés dans le registre de tâches",
+                       callback=lambda: request_status.stats()['bytes'])
+
+def job_store_removals():
+    """Entrées retirées du registre depuis le démarrage, par motif (éviction LRU ou TTL)"""
+    stats = request_status.stats()
+    return {'evicted': stats['evictions'], 'expired': stats['expirations']}
+
+metrics.REGISTRY.counter('job_store_removals_total', "Entrées retirées du registre de tâches",
+                         ('reason',), callback=job_store_removals)
+
+# Exports multi-adresses : nombre maximal d'adresses et de récupérations parallèles
+PORTFOLIO_MAX_ADDRESSES = int(os.environ.get('PORTFOLIO_MAX_ADDRESSES', '50'))
+PORTFOLIO_PARALLEL = int(os.environ.get('PORTFOLIO_PARALLEL', '8'))
+
+# Récupération partitionnée des gros wallets : 'rarity' (une chaîne de
+# curseurs par rareté, en parallèle) ou 'none' (une seule chaîne). Seulement
+# pour les rapports filtrés par rareté : l'API ne donne pas le nombre de NFTs
+# d'un wallet, rien ne prouverait que les partitions couvrent un rapport
+# complet (NFTs d'une rareté absente de query_plan.RARITIES ou sans rareté).
+FETCH_PARTITIONING = os.environ.get('FETCH_PARTITIONING', 'rarity')
+FETCH_PARALLEL = int(os.environ.get('FETCH_PARALLEL', '7'))
+# Taille (en pages, d'après l'instantané) au-delà de laquelle une
+# synchronisation complète est partitionnée : chaque partition coûte au
+# moins une page, ce n'est rentable que pour les gros wallets. La décision
+# est prise avant la première page, qui n'est donc jamais relue.
+FETCH_PARTITION_MIN_PAGES = int(os.environ.get('FETCH_PARTITION_MIN_PAGES', '5'))
+
+# Reprises automatiques d'une récupération en échec (au dernier curseur
+# enregistré, voir asset_store) et délai avant chaque reprise (secondes,
+# multiplié par le numéro de la tentative)
+FETCH_RESUME_RETRIES = int(os.environ.get('FETCH_RESUME_RETRIES', '2'))
+FETCH_RESUME_DELAY = float(os.environ.get('FETCH_RESUME_DELAY', '1'))
+
+# Point de reprise de la chaîne de curseurs unique (les partitions utilisent leur signature)
+MAIN_CHAIN = 'main'
+
+# Moteur d'agrégation : 'python' (boucle) ou 'numpy' (vectorisé, si installé)
+AGGREGATION_ENGINE = os.environ.get('AGGREGATION_ENGINE', 'python')
+
+# Taille des morceaux envoyés par /download
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
 
 # Regex pour valider les adresses Ethereum
 ETH_ADDRESS_REGEX = re.compile(r'^0x[a-fA-F0-9]{40}$')
@@ -25,73 +95,242 @@ def is_valid_eth_address(address):
     """Vérifie si l'adresse est une adresse Ethereum valide"""
     return bool(ETH_ADDRESS_REGEX.match(address))
 
-def fetch_assets_for_address(address):
-    """Récupère les NFTs pour une adresse spécifique depuis l'API ImmutableX avec pagination"""
-    assets = []
-    cursor = None
-    page_size = 200  # Taille de page maximale autorisée
-    
-    # Initialiser le statut de la requête
-    request_status[address] = {
-        'status': 'processing',
-        'count': 0,
-        'assets': [],
-        'error': None
-    }
+def normalize_address(address):
+    """Forme canonique d'une adresse (ou d'un identifiant de tâche) : sans espaces, en minuscules
+
+    Les adresses Ethereum ne diffèrent que par la casse (somme de contrôle
+    EIP-55) : 0xABC... et 0xabc... désignent le même wallet.
+    """
+    return address.strip().lower()
+
+class FetchError(Exception):
+    """Échec de la récupération des NFTs auprès de l'API ImmutableX"""
+
+def snapshot_scope(address, query):
+    """Clé de l'instantané local : une adresse et un jeu de filtres"""
+    return f"{address}:{query.signature()}"
+
+def walk_cursor_chain(address, api_params, since, on_page, cursor=None, max_pages=None, on_checkpoint=None):
+    """Parcourt une chaîne de curseurs /v1/assets (de toute la collection si address est None)
+
+    on_page reçoit chaque page non vide, puis on_checkpoint (optionnel) le
+    curseur de la page suivante (None en fin de chaîne) et le nombre de
+    pages lues. S'arrête après max_pages pages si indiqué. Retourne (pages,
+    octets reçus, curseur suivant ou None).
+    """
+    pages = 0
+    fetched_bytes = 0
     
-    try:
-        while True:
-            url = f"https://api.x.immutable.com/v1/assets?user={address}&page_size={page_size}"
-            if cursor:
-                url += f"&cursor={cursor}"
-            
-            try:
-                response = requests.get(url, headers={'User-Agent': 'Mozilla/5.0'})
-                
-                if response.status_code != 200:
-                    request_status[address]['status'] = 'error'
-                    request_status[address]['error'] = f"Erreur API: {response.status_code}"
-                    return []
-                
-                data = response.json()
-                
-                if 'result' not in data:
-                    break
-                
-                batch = data['result']
-                if not batch:
-                    break
-                
-                assets.extend(batch)
-                request_status[address]['count'] = len(assets)
-                request_status[address]['assets'] = assets
-                
-                # Vérifier s'il y a une page suivante
-                cursor = data.get('cursor')
-                if not cursor:
-                    break
-                
-                # Pause pour éviter de surcharger l'API
-                import time
-                time.sleep(0.5)
-                
-            except Exception as e:
-                app.logger.error(f"Erreur lors de la récupération des NFTs: {str(e)}")
-                request_status[address]['status'] = 'error'
-                request_status[address]['error'] = str(e)
-                return assets
+    while max_pages is None or pages < max_pages:
+        params = {'page_size': PAGE_SIZE}
+        if address:
+            params['user'] = address
+        params.update(api_params)
+        if since:
+            params['updated_min_timestamp'] = since
+        if cursor:
+            params['cursor'] = cursor
         
-        request_status[address]['status'] = 'processing_complete'
-        return assets
+        response = get_client().get_assets(params)
+        pages += 1
+        fetched_bytes += response.wire_bytes
         
-    except Exception as e:
-        app.logger.error(f"Erreur lors de la récupération des NFTs: {str(e)}")
-        request_status[address]['status'] = 'error'
-        request_status[address]['error'] = str(e)
-        return assets
+        if response.status_code != 200:
+            raise FetchError(f"Erreur API: {response.status_code}")
+        
+        data = get_client().decode_assets(response)
+        
+        batch = data.get('result')
+        # Vérifier s'il y a une page suivante
+        cursor = (data.get('cursor') or None) if batch else None
+        if batch:
+            on_page(batch)
+        if on_checkpoint:
+            # Page enregistrée : une reprise repartira du curseur suivant
+            on_checkpoint(cursor, pages)
+        
+        if not cursor:
+            return pages, fetched_bytes, None
+    
+    return pages, fetched_bytes, cursor
+
+def fetch_partitions(query, since, known_count):
+    """Partitions à parcourir en parallèle (liste vide : chaîne unique)
+
+    Une partition par rareté filtrée : le filtre de rareté est déjà poussé
+    vers l'API, les partitions couvrent donc exactement le rapport. Seulement
+    pour une synchronisation complète d'un wallet que l'instantané sait
+    gros (known_count NFTs) ; la taille d'un delta n'est pas connue d'avance.
+    """
+    if FETCH_PARTITIONING != 'rarity' or not query.rarities or since:
+        return []
+    partitions = query.partitions()
+    if len(partitions) < 2 or pages_for(known_count) <= FETCH_PARTITION_MIN_PAGES:
+        return []
+    return partitions
+
+def sync_wallet(address, on_progress=None, query=None, on_resume=None):
+    """Synchronise l'instantané local (asset_store) d'une adresse avec l'API ImmutableX
+
+    Les filtres du rapport (query) sont poussés vers l'API ; les NFTs sont
+    enregistrés page par page ; si l'adresse a déjà été synchronisée, seuls
+    les NFTs modifiés depuis la dernière synchronisation sont demandés à
+    l'API. Un gros wallet déjà connu, filtré par rareté, est récupéré par
+    partitions (une chaîne de curseurs par rareté, voir fetch_partitions)
+    parcourues en parallèle.
+    Chaque chaîne enregistre un point de reprise après chaque page : une
+    synchronisation interrompue reprend là où elle s'est arrêtée, et
+    on_resume reçoit alors la page de reprise (la plus avancée des chaînes
+    parcourues en parallèle).
+    on_progress reçoit le nombre de NFTs distincts récupérés.
+    Retourne (nombre de NFTs stockés, statistiques de transfert et date de
+    la dernière synchronisation complète), lève FetchError en cas d'erreur
+    API.
+    """
+    if query is None:
+        query = ReportQuery()
+    store = get_asset_store()
+    scope = snapshot_scope(address, query)
+    since, full_sync, sync_started = store.begin_sync(scope)
+    metrics.CACHE_LOOKUPS.inc(1, 'asset_snapshot', 'miss' if full_sync else 'hit')
+    checkpoints = store.checkpoints(scope)
+    resumed_pages = sum(pages for _, pages, _ in checkpoints.values())
+    resumed_count = 0
+    if checkpoints:
+        metrics.FETCH_RESUMES.inc()
+        resumed_count = store.count(scope, seen_since=sync_started)
+        if on_resume:
+            on_resume(max(pages for _, pages, _ in checkpoints.values()))
+    seen = set()
+    seen_lock = threading.Lock()
+    
+    def on_page(batch):
+        # Enregistrer la page dans l'instantané (après filtrage local résiduel) puis l'oublier
+        store.upsert(scope, [record for record in process_assets(batch) if query.matches(record)], sync_started)
+        with seen_lock:
+            seen.update(asset.get('token_id') for asset in batch)
+            total = resumed_count + len(seen)
+        if on_progress:
+            on_progress(total)
+    
+    def walk(chain, api_params):
+        # Parcourt une chaîne de curseurs depuis son point de reprise
+        cursor, pages_done, done = checkpoints.get(chain, (None, 0, False))
+        if done:
+            return 0, 0, None
+        
+        def on_checkpoint(next_cursor, pages):
+            store.save_checkpoint(scope, chain, next_cursor, pages_done + pages, done=not next_cursor)
+        return walk_cursor_chain(address, api_params, since, on_page, cursor, on_checkpoint=on_checkpoint)
+    
+    # Une synchronisation reprise garde le découpage de sa première tentative
+    partitions = [] if MAIN_CHAIN in checkpoints else fetch_partitions(query, since, store.count(scope))
+    if partitions:
+        with ThreadPoolExecutor(max_workers=min(FETCH_PARALLEL, len(partitions))) as pool:
+            results = list(pool.map(lambda partition: walk(partition.signature(), partition.api_params()),
+                                    partitions))
+    else:
+        results = [walk(MAIN_CHAIN, query.api_params())]
+    pages = sum(chain_pages for chain_pages, _, _ in results)
+    fetched_bytes = sum(chain_bytes for _, chain_bytes, _ in results)
+    
+    store.finish_sync(scope, sync_started, full_sync)
+    count = store.count(scope)
+    stats = transfer_stats(address, count, pages, fetched_bytes, resumed_pages)
+    stats['resumed_pages'] = resumed_pages
+    # Les NFTs sortis du wallet depuis cette date peuvent encore être comptés
+    stats['last_full_sync'] = store.last_full_sync(scope)
+    return count, stats
+
+def indexed_wallet(address, query):
+    """NFTs d'une adresse lus dans l'index des propriétaires (owner_index)
+
+    Retourne None si l'index ne peut pas répondre : pas construit, autre
+    collection, ou pas rafraîchi depuis OWNER_INDEX_MAX_AGE. Les NFTs sont
+    alors récupérés auprès d'ImmutableX (sync_wallet).
+    """
+    index = get_owner_index()
+    if index is None or not index.covers(query.collection):
+        return None
+    if not index.is_fresh():
+        metrics.CACHE_LOOKUPS.inc(1, 'owner_index', 'stale')
+        return None
+    with metrics.STAGE_SECONDS.time('owner_index'):
+        records = [record for record in index.iter_owner(address) if query.matches(record)]
+    metrics.CACHE_LOOKUPS.inc(1, 'owner_index', 'hit')
+    return records
+
+def transfer_stats(address, count, pages, fetched_bytes, resumed_pages=0):
+    """Statistiques de transfert d'une synchronisation
+
+    pages et fetched_bytes sont ceux de la dernière tentative ; resumed_pages
+    compte les pages lues par les tentatives précédentes (points de reprise),
+    qui ne sont pas des pages évitées. Pages évitées par rapport à une
+    synchronisation complète du rapport le plus large connu pour cette
+    adresse (None si aucune référence).
+    """
+    baseline = max(count, get_asset_store().count(snapshot_scope(address, ReportQuery())))
+    stats = {'pages': pages, 'bytes': fetched_bytes, 'pages_avoided': None, 'bytes_avoided': None}
+    if baseline:
+        stats['pages_avoided'] = max(0, pages_for(baseline) - pages - resumed_pages)
+        # Aucune page lue (reprise dont toutes les chaînes étaient terminées) : taille d'une page inconnue
+        if pages:
+            stats['bytes_avoided'] = stats['pages_avoided'] * (fetched_bytes // pages)
+    return stats
+
+def fetch_assets_for_address(address, query=None, job_id=None):
+    """Récupère les NFTs pour une adresse spécifique depuis l'API ImmutableX avec pagination
+
+    Retourne les compteurs par carte (voir aggregate_assets).
+    """
+    if query is None:
+        query = ReportQuery()
+    job_id = job_id or address
+    
+    # Passer la tâche en cours (en gardant les champs posés par /process)
+    if request_status.peek(job_id) is None:
+        request_status[job_id] = {'status': 'processing', 'count': 0, 'error': None, 'resumed_from_page': 0,
+                                  'source': 'api', 'last_full_sync': None}
+    else:
+        request_status.update_job(job_id, status='processing', count=0, error=None, resumed_from_page=0, source='api',
+                                  last_full_sync=None)
+    
+    records = indexed_wallet(address, query)
+    if records is not None:
+        # Lecture locale : toutes les pages de l'export sont évitées
+        request_status.update_job(job_id, count=len(records), status='processing_complete', source='owner_index',
+                                  pages_avoided=pages_for(len(records)), bytes_avoided=None)
+        return aggregate_assets(records)
+    
+    on_progress = lambda total: request_status.update_job(job_id, count=total)
+    on_resume = lambda pages: request_status.update_job(job_id, resumed_from_page=pages)
+    attempt = 0
+    while True:
+        try:
+            with metrics.STAGE_SECONDS.time('fetch'):
+                count, stats = sync_wallet(address, on_progress, query, on_resume)
+            break
+        except Exception as e:
+            if attempt < FETCH_RESUME_RETRIES:
+                # Les pages déjà enregistrées ne seront pas redemandées
+                attempt += 1
+                app.logger.warning(f"{job_id}: {str(e)}, reprise au dernier curseur ({attempt}/{FETCH_RESUME_RETRIES})")
+                time.sleep(FETCH_RESUME_DELAY * attempt)
+                continue
+            app.logger.error(f"Erreur lors de la récupération des NFTs: {str(e)}")
+            request_status.update_job(job_id, status='error', error=str(e))
+            return new_counts()
+    
+    app.logger.info(f"{job_id}: {stats['pages']} page(s), {stats['bytes']} octets, "
+                    f"{stats['pages_avoided']} page(s) évitée(s)")
+    request_status.update_job(job_id, count=count, status='processing_complete',
+                              pages_avoided=stats['pages_avoided'], bytes_avoided=stats['bytes_avoided'],
+                              last_full_sync=stats['last_full_sync'])
+    return aggregate_assets(get_asset_store().iter_processed(snapshot_scope(address, query)))
 
 def process_assets(assets):
     """Traite les NFTs pour extraire les informations nécessaires"""
+    started = time.perf_counter()
     processed_data = []
     
     for asset in assets:
@@ -108,92 +347,136 @@ def process_assets(assets):
             grade = metadata.get('grade', '')
             is_foil = metadata.get('foil', False)
             
-            # Ajouter à la liste des données traitées
-            processed_data.append({
-                'name': name,
-                'rarity': rarity,
-                'element': element,
-                'advancement': advancement,
-                'faction': faction,
-                'grade': grade,
-                'is_foil': is_foil
-            })
+            # Ajouter à la liste des données traitées (enregistrement compact)
+            processed_data.append(CardRecord(
+                name, rarity, element, advancement, faction, grade, is_foil,
+                token_id=asset.get('token_id', ''),
+                updated_at=asset.get('updated_at', '')
+            ))
             
         except Exception as e:
             app.logger.error(f"Erreur lors du traitement d'un NFT: {e}")
             continue
     
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, 'process_assets')
     return processed_data
 
-def generate_csv(processed_data):
-    """Génère un fichier CSV avec les données traitées"""
-    # Définir l'ordre des raretés pour le tri
-    RARITY_ORDER = {
-        'MYTHIC': 1,
-        'ULTRA_RARE': 2, 
-        'SPECIAL_RARE': 3,
-        'RARE': 4,
-        'UNCOMMON': 5,
-        'COMMON': 6,
-        'EXCLUSIVE': 7
-    }
+# Définir l'ordre des raretés pour le tri
+RARITY_ORDER = {
+    'MYTHIC': 1,
+    'ULTRA_RARE': 2, 
+    'SPECIAL_RARE': 3,
+    'RARE': 4,
+    'UNCOMMON': 5,
+    'COMMON': 6,
+    'EXCLUSIVE': 7
+}
 
-    # Définir l'ordre des avancements pour le tri
-    ADVANCEMENT_ORDER = {
-        'COMBO': 1,
-        'ALTERNATIVE': 2,
-        'STANDARD': 3
-    }
+# Définir l'ordre des avancements pour le tri
+ADVANCEMENT_ORDER = {
+    'COMBO': 1,
+    'ALTERNATIVE': 2,
+    'STANDARD': 3
+}
+
+CSV_FIELDNAMES = [
+    'nom', 'rareté', 'élément', 'avancement', 'faction',
+    'Standard', 'C', 'B', 'A', 'S',
+    'foil_Standard', 'foil_C', 'foil_B', 'foil_A', 'foil_S'
+]
+
+def new_counts():
+    """Crée une structure vide pour stocker les comptages
     
-    # Créer une structure pour stocker les comptages
-    # Clé: (nom, rareté, élément, avancement, faction)
-    # Valeur: compteurs pour Standard, C, B, A, S et leurs versions foil
-    counts = defaultdict(lambda: {
-        'Standard': 0, 'C': 0, 'B': 0, 'A': 0, 'S': 0,
-        'foil_Standard': 0, 'foil_C': 0, 'foil_B': 0, 'foil_A': 0, 'foil_S': 0
-    })
+    Clé: identifiant de la carte dans le catalogue (card_catalog)
+    Valeur: compteurs Standard, C, B, A, S puis leurs versions foil
+    """
+    return defaultdict(new_counter)
+
+def use_numpy_engine():
+    """Indique si le moteur d'agrégation NumPy est demandé et disponible"""
+    return AGGREGATION_ENGINE == 'numpy' and fast_aggregate.available()
+
+def aggregate_assets(processed_data, counts=None):
+    """Ajoute les NFTs traités aux compteurs par carte et retourne les compteurs"""
+    if counts is None:
+        counts = new_counts()
     
-    # Compter les cartes par nom, rareté, élément, avancement et faction
+    started = time.perf_counter()
+    if use_numpy_engine():
+        card_ids, matrix = fast_aggregate.aggregate_numpy(processed_data)
+        counts = fast_aggregate.counts_from_matrix(card_ids, matrix, counts)
+        metrics.STAGE_SECONDS.observe(time.perf_counter() - started, 'aggregate')
+        return counts
+    
+    # Compter les cartes par identifiant du catalogue (grade vide = Standard,
+    # grades inconnus ignorés)
+    catalog = get_catalog()
+    get_id = catalog.ids.get
+    get_slot = GRADE_SLOTS.get
+    counted = 0
+    misses = 0
     for item in processed_data:
-        name = item['name']
-        rarity = item['rarity']
-        element = item['element']
-        advancement = item['advancement']
-        faction = item['faction']
-        grade = item['grade']
-        is_foil = item['is_foil']
-        
-        key = (name, rarity, element, advancement, faction)
-        
-        if not grade:  # Si grade est vide, c'est Standard
-            counts[key]['Standard'] += 1
-            if is_foil:
-                counts[key]['foil_Standard'] += 1
-        elif grade in ['C', 'B', 'A', 'S']:
-            counts[key][grade] += 1
-            if is_foil:
-                counts[key][f'foil_{grade}'] += 1
+        slot = get_slot(item.grade)
+        if slot is None:
+            continue
+        card_id = get_id(item.key())
+        if card_id is None:
+            card_id = catalog.add(item.key())
+            misses += 1
+        counter = counts[card_id]
+        counter[slot] += 1
+        if item.is_foil:
+            counter[slot + FOIL_OFFSET] += 1
+        counted += 1
+    catalog.record_lookups(counted - misses, misses)
     
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, 'aggregate')
+    return counts
+
+def merge_counts(counts, other):
+    """Ajoute les compteurs other aux compteurs counts et retourne counts"""
+    for card_id, counter in other.items():
+        target = counts[card_id]
+        for index, value in enumerate(counter):
+            target[index] += value
+    return counts
+
+def card_total(counter):
+    """Nombre total d'exemplaires d'une carte (les foils sont inclus dans chaque grade)"""
+    return sum(counter[:FOIL_OFFSET])
+
+def save_card_catalog():
+    """Enregistre le catalogue de cartes s'il a grandi (un échec n'interrompt pas la tâche)"""
+    try:
+        get_catalog().save()
+    except OSError as e:
+        app.logger.warning(f"Impossible d'enregistrer le catalogue de cartes: {str(e)}")
+
+def write_csv(counts, breakdown=None):
+    """Génère le contenu CSV à partir des compteurs par carte
+
+    breakdown (optionnel) associe à chaque carte (identifiant du catalogue)
+    le nombre d'exemplaires par adresse ; il est alors ajouté dans une colonne 'adresses'.
+    """
+    started = time.perf_counter()
+    catalog = get_catalog()
     # Convertir en liste pour le tri
     result = []
-    for (name, rarity, element, advancement, faction), grades in counts.items():
-        result.append({
+    for card_id, counter in counts.items():
+        name, rarity, element, advancement, faction = catalog.key(card_id)
+        row = {
             'nom': name,
             'rareté': rarity,
             'élément': element,
             'avancement': advancement,
-            'faction': faction,
-            'Standard': grades['Standard'],
-            'C': grades['C'],
-            'B': grades['B'],
-            'A': grades['A'],
-            'S': grades['S'],
-            'foil_Standard': grades['foil_Standard'],
-            'foil_C': grades['foil_C'],
-            'foil_B': grades['foil_B'],
-            'foil_A': grades['foil_A'],
-            'foil_S': grades['foil_S']
-        })
+            'faction': faction
+        }
+        row.update(counter_dict(counter))
+        if breakdown is not None:
+            per_address = breakdown.get(card_id, {})
+            row['adresses'] = ', '.join(f"{addr}:{n}" for addr, n in per_address.items())
+        result.append(row)
     
     # Trier par rareté puis par avancement
     result.sort(key=lambda x: (
@@ -203,62 +486,160 @@ def generate_csv(processed_data):
     
     # Créer un fichier CSV en mémoire
     output = io.StringIO()
-    fieldnames = [
-        'nom', 'rareté', 'élément', 'avancement', 'faction',
-        'Standard', 'C', 'B', 'A', 'S',
-        'foil_Standard', 'foil_C', 'foil_B', 'foil_A', 'foil_S'
-    ]
+    fieldnames = CSV_FIELDNAMES + ['adresses'] if breakdown is not None else CSV_FIELDNAMES
     writer = csv.DictWriter(output, fieldnames=fieldnames, delimiter=';')
     writer.writeheader()
     writer.writerows(result)
     
+    metrics.STAGE_SECONDS.observe(time.perf_counter() - started, 'write_csv')
     return output.getvalue()
 
-def process_address_async(address):
+def generate_csv(processed_data):
+    """Génère un fichier CSV avec les données traitées"""
+    if use_numpy_engine():
+        with metrics.STAGE_SECONDS.time('aggregate'):
+            card_ids, matrix = fast_aggregate.aggregate_numpy(processed_data)
+        with metrics.STAGE_SECONDS.time('write_csv'):
+            keys = [get_catalog().key(card_id) for card_id in card_ids]
+            return fast_aggregate.write_csv_numpy(keys, matrix, CSV_FIELDNAMES, RARITY_ORDER, ADVANCEMENT_ORDER)
+    return write_csv(aggregate_assets(processed_data))
+
+def run_job(job_id, func, *args):
+    """Exécute le corps d'une tâche dans un worker : toute exception passe la tâche en erreur
+
+    Une tâche restée active rattacherait indéfiniment (claim) les requêtes
+    suivantes pour ce wallet à un export qui ne se terminera jamais.
+    """
+    try:
+        func(*args)
+    except Exception as e:
+        app.logger.exception(f"{job_id}: erreur inattendue")
+        request_status.update_job(job_id, status='error', error=str(e))
+
+def process_address_async(address, query=None, job_id=None):
     """Traite l'adresse de manière asynchrone"""
-    assets = fetch_assets_for_address(address)
-    if assets:
-        processed_data = process_assets(assets)
-        csv_content = generate_csv(processed_data)
-        request_status[address]['csv_content'] = csv_content
-        request_status[address]['status'] = 'complete'
+    job_id = job_id or address
+    counts = fetch_assets_for_address(address, query, job_id)
+    if counts:
+        # Stocker le CSV déjà encodé : /download l'envoie sans autre copie
+        csv_content = write_csv(counts).encode('utf-8')
+        request_status.update_job(job_id, csv_content=csv_content, result_hash=result_cache.content_hash(csv_content),
+                                  status='complete')
+        save_card_catalog()
     else:
-        if request_status[address]['status'] != 'error':
-            request_status[address]['status'] = 'error'
-            request_status[address]['error'] = "Aucun NFT trouvé"
+        if request_status.peek(job_id)['status'] != 'error':
+            request_status.update_job(job_id, status='error', error="Aucun NFT trouvé")
+
+def process_portfolio_async(job_id, addresses, breakdown):
+    """Traite un portefeuille de plusieurs adresses et fusionne leurs compteurs
+
+    Les adresses sont récupérées en parallèle ; le limiteur de débit du client
+    partagé fait office de budget commun pour toutes les requêtes.
+    """
+    store = get_asset_store()
+    progress = {}
+    progress_lock = threading.Lock()
+    
+    def report(address, total):
+        with progress_lock:
+            progress[address] = total
+            count = sum(progress.values())
+        request_status.update_job(job_id, count=count)
+    
+    def fetch_one(address):
+        records = indexed_wallet(address, ReportQuery())
+        if records is not None:
+            report(address, len(records))
+            return address, aggregate_assets(records)
+        with metrics.STAGE_SECONDS.time('fetch'):
+            sync_wallet(address, lambda total: report(address, total))
+        return address, aggregate_assets(store.iter_processed(snapshot_scope(address, ReportQuery())))
+    
+    request_status.update_job(job_id, status='processing')
+    try:
+        with ThreadPoolExecutor(max_workers=min(PORTFOLIO_PARALLEL, len(addresses))) as pool:
+            results = list(pool.map(fetch_one, addresses))
+    except Exception as e:
+        app.logger.error(f"Erreur lors de la récupération du portefeuille: {str(e)}")
+        request_status.update_job(job_id, status='error', error=str(e))
+        return
+    
+    merged = new_counts()
+    details = defaultdict(dict) if breakdown else None
+    total = 0
+    for address, counts in results:
+        merge_counts(merged, counts)
+        for key, grades in counts.items():
+            total += card_total(grades)
+            if breakdown:
+                details[key][address] = card_total(grades)
+    
+    if not merged:
+        request_status.update_job(job_id, status='error', error="Aucun NFT trouvé")
+        return
+    
+    csv_content = write_csv(merged, details).encode('utf-8')
+    request_status.update_job(job_id, count=total, csv_content=csv_content,
+                              result_hash=result_cache.content_hash(csv_content), status='complete')
+    save_card_catalog()
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # Suivi par polling de /status : un flux /events occuperait un thread
+    # gunicorn par onglet ouvert (asgi.py sert /events sans thread)
+    return render_template('index.html', events_enabled=False)
 
-@app.route('/process', methods=['POST'])
-def process():
-    address = request.form.get('address')
+def parse_process_form(form):
+    """Valide le formulaire de /process
+
+    Retourne (adresse, options du rapport, identifiant de tâche) ; lève
+    ValueError avec le message destiné au client.
+    """
+    address = form.get('address')
     
     if not address:
-        return jsonify({'error': 'Adresse non fournie'}), 400
+        raise ValueError('Adresse non fournie')
     
+    address = normalize_address(address)
     if not is_valid_eth_address(address):
-        return jsonify({'error': 'Adresse Ethereum invalide'}), 400
+        raise ValueError('Adresse Ethereum invalide')
+    
+    # Options du rapport (collection, raretés, grades, foil), poussées vers l'API
+    query = ReportQuery.from_form(form)
     
-    # Vérifier si un traitement est déjà en cours pour cette adresse
-    if address in request_status and request_status[address]['status'] in ['processing', 'processing_complete']:
-        return jsonify({'message': 'Traitement déjà en cours', 'address': address}), 200
+    # Le rapport complet garde l'adresse comme identifiant de tâche
+    job_id = address if query.is_default() else f"{address}:{query.signature()}"
+    return address, query, job_id
+
+@app.route('/process', methods=['POST'])
+def process():
+    try:
+        address, query, job_id = parse_process_form(request.form)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Initialiser le statut
-    request_status[address] = {
-        'status': 'processing',
+    # Créer la tâche, ou rattacher la requête à celle déjà en cours pour ce
+    # wallet et ces options (elle en partagera le résultat)
+    job = request_status.claim(job_id, {
+        'status': 'queued',
         'count': 0,
-        'assets': [],
-        'error': None
-    }
+        'error': None,
+        'requests': 1
+    })
+    if job is not None:
+        metrics.JOBS_DEDUPLICATED.inc(1, 'process')
+        return jsonify({'message': 'Traitement déjà en cours', 'address': job_id}), 200
     
-    # Démarrer le traitement dans un thread séparé
-    thread = threading.Thread(target=process_address_async, args=(address,))
-    thread.daemon = True
-    thread.start()
+    # Mettre le traitement dans la file des workers
+    try:
+        position = scheduler.submit(job_id, run_job, job_id, process_address_async, address, query, job_id)
+    except QueueFullError:
+        del request_status[job_id]
+        return jsonify({'error': 'Serveur surchargé, veuillez réessayer dans quelques instants'}), 503
+    # Position connue des autres workers (la file elle-même est locale)
+    request_status.update_job(job_id, queue_position=position)
     
-    return jsonify({'message': 'Traitement démarré', 'address': address}), 200
+    return jsonify({'message': 'Traitement démarré', 'address': job_id, 'queue_position': position}), 200
 
 @app.route('/status', methods=['GET'])
 def status():
@@ -267,43 +648,151 @@ def status():
     if not address:
         return jsonify({'error': 'Adresse non fournie'}), 400
     
-    if address not in request_status:
+    address = normalize_address(address)
+    snapshot = job_snapshot(address)
+    if snapshot is None:
         return jsonify({'error': 'Aucun traitement en cours pour cette adresse'}), 404
     
-    status_data = {
-        'status': request_status[address]['status'],
-        'count': request_status[address]['count'],
-        'error': request_status[address]['error']
+    return jsonify(snapshot), 200
+
+def job_snapshot(address):
+    """Retourne l'état public d'une tâche (None si inconnue)"""
+    job = request_status.peek(address)
+    if job is None:
+        return None
+    return {
+        'status': job['status'],
+        'count': job['count'],
+        'error': job['error'],
+        'queue_position': scheduler.position(address) or (job.get('queue_position', 0) if job['status'] == 'queued' else 0),
+        'pages_avoided': job.get('pages_avoided'),
+        'bytes_avoided': job.get('bytes_avoided'),
+        'requests': job.get('requests', 1),
+        'resumed_from_page': job.get('resumed_from_page', 0),
+        'source': job.get('source', 'api'),
+        'last_full_sync': job.get('last_full_sync')
     }
+
+def prepare_download(address, report_format, accept_encoding, if_none_match):
+    """Prépare la réponse de /download : (statut HTTP, corps, en-têtes)
+
+    Le corps vaut None pour une réponse 304 et un dict pour une erreur JSON.
+    Le résultat n'est chargé que si le client ne l'a pas déjà.
+    """
+    if report_format not in report_formats.available_formats():
+        return 400, {'error': f"Format non disponible: {report_format} "
+                              f"(disponibles: {', '.join(report_formats.available_formats())})"}, {}
+    
+    job = request_status.peek(address)
+    if job is None:
+        return 404, {'error': 'Aucun traitement en cours pour cette adresse'}, {}
+    
+    if job['status'] != 'complete':
+        return 400, {'error': 'Le traitement n\'est pas terminé'}, {}
+    
+    output_format = report_formats.FORMATS[report_format]
+    encoding = result_cache.negotiate(accept_encoding) if output_format.compressible else 'identity'
+    digest = job.get('result_hash')
+    if digest:
+        tag = result_cache.etag(report_formats.variant(digest, report_format), encoding)
+        if result_cache.not_modified(if_none_match, tag):
+            result_cache.DOWNLOADS.inc(1, 304, report_format, encoding)
+            return 304, None, result_cache.response_headers(tag, encoding)
     
-    return jsonify(status_data), 200
+    job = request_status.get(address)
+    if job is None or 'csv_content' not in job:
+        return 404, {'error': 'Aucun contenu CSV disponible'}, {}
+    
+    payload = job['csv_content']
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    digest = digest or result_cache.content_hash(payload)
+    # Conversion et compression calculées une fois puis servies depuis le cache
+    payload = report_formats.convert_cached(payload, digest, report_format)
+    body = result_cache.get_result_cache().encode(payload, report_formats.variant(digest, report_format), encoding)
+    result_cache.DOWNLOADS.inc(1, 200, report_format, encoding)
+    
+    filename = result_cache.result_filename(f'nfts_{address}', digest, output_format.extension)
+    headers = result_cache.response_headers(result_cache.etag(report_formats.variant(digest, report_format), encoding),
+                                            encoding, filename)
+    headers['Content-Type'] = output_format.content_type
+    headers['Content-Length'] = str(len(body))
+    return 200, body, headers
 
 @app.route('/download', methods=['GET'])
 def download():
+    """Résultat d'une tâche ; format=csv (défaut), jsonl, parquet ou arrow"""
     address = request.args.get('address')
     
     if not address:
         return jsonify({'error': 'Adresse non fournie'}), 400
     
-    if address not in request_status:
-        return jsonify({'error': 'Aucun traitement en cours pour cette adresse'}), 404
+    status, body, headers = prepare_download(normalize_address(address), request.args.get('format', 'csv'),
+                                             request.headers.get('Accept-Encoding'),
+                                             request.headers.get('If-None-Match'))
+    if isinstance(body, dict):
+        return jsonify(body), status
+    if body is None:
+        return Response(status=status, headers=headers)
+    
+    def stream():
+        # Envoyer le contenu stocké par morceaux, sans le recopier en entier
+        view = memoryview(body)
+        for start in range(0, len(view), DOWNLOAD_CHUNK_SIZE):
+            yield view[start:start + DOWNLOAD_CHUNK_SIZE].tobytes()
+    
+    return Response(stream(), status=status, headers=headers)
+
+@app.route('/portfolio', methods=['POST'])
+def portfolio():
+    """Démarre l'export fusionné de plusieurs adresses
+
+    Les adresses sont séparées par des virgules, espaces ou retours à la ligne.
+    La tâche retournée se suit avec /status (ou /events sous uvicorn) et
+    /download comme une adresse simple.
+    """
+    raw = request.form.get('addresses', '')
+    addresses = list(dict.fromkeys(normalize_address(a) for a in re.split(r'[\s,;]+', raw) if a))
+    breakdown = request.form.get('breakdown', '') in ('1', 'true', 'on')
     
-    if request_status[address]['status'] != 'complete':
-        return jsonify({'error': 'Le traitement n\'est pas terminé'}), 400
+    if not addresses:
+        return jsonify({'error': 'Adresses non fournies'}), 400
     
-    if 'csv_content' not in request_status[address]:
-        return jsonify({'error': 'Aucun contenu CSV disponible'}), 404
+    invalid = [a for a in addresses if not is_valid_eth_address(a)]
+    if invalid:
+        return jsonify({'error': f"Adresse(s) Ethereum invalide(s): {', '.join(invalid)}"}), 400
     
-    # Créer un fichier CSV à partir du contenu stocké
-    output = io.StringIO(request_status[address]['csv_content'])
+    if len(addresses) > PORTFOLIO_MAX_ADDRESSES:
+        return jsonify({'error': f"Trop d'adresses (maximum {PORTFOLIO_MAX_ADDRESSES})"}), 400
     
-    # Préparation du fichier à télécharger
-    return send_file(
-        io.BytesIO(output.getvalue().encode('utf-8')),
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name=f'nfts_{address}_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv'
-    )
+    # Identifiant stable pour un même ensemble d'adresses et d'options
+    digest = hashlib.sha1(('|'.join(sorted(addresses)) + f'|{breakdown}').encode()).hexdigest()[:16]
+    job_id = f'portfolio-{digest}'
+    
+    job = request_status.claim(job_id, {
+        'status': 'queued',
+        'count': 0,
+        'error': None,
+        'requests': 1,
+        'addresses': addresses
+    })
+    if job is not None:
+        metrics.JOBS_DEDUPLICATED.inc(1, 'portfolio')
+        return jsonify({'message': 'Traitement déjà en cours', 'address': job_id}), 200
+    
+    try:
+        position = scheduler.submit(job_id, run_job, job_id, process_portfolio_async, job_id, addresses, breakdown)
+    except QueueFullError:
+        del request_status[job_id]
+        return jsonify({'error': 'Serveur surchargé, veuillez réessayer dans quelques instants'}), 503
+    request_status.update_job(job_id, queue_position=position)
+    
+    return jsonify({'message': 'Traitement démarré', 'address': job_id, 'queue_position': position}), 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métriques du worker au format texte Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
 
 # Garder cette route pour la compatibilité avec les anciens appels
 @app.route('/get_nfts', methods=['POST'])
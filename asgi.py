@@ -0,0 +1,427 @@
+import os
+import json
+import asyncio
+import logging
+from urllib.parse import parse_qsl
+
+import app as wsgi
+import async_fetch
+import metrics
+import result_cache
+from asset_store import get_asset_store
+from query_plan import ReportQuery, PAGE_SIZE, pages_for
+
+# Point d'entrée ASGI : uvicorn asgi:app
+# Sert /process, /status, /events et /download (ainsi que / et /metrics) avec
+# une coroutine par export au lieu d'un thread du pool JobScheduler. Les tâches
+# partagent le registre (request_status), l'instantané local et la génération
+# CSV de l'application WSGI, qui reste servie par gunicorn wsgi:app.
+# Sans aiohttp, la récupération passe par sync_wallet dans un thread.
+
+# Exports menés simultanément par le processus (les suivants restent 'queued')
+ASYNC_MAX_JOBS = int(os.environ.get('ASYNC_MAX_JOBS', '1000'))
+
+# Flux SSE de progression (/events) : intervalle de vérification côté serveur
+# et durée maximale d'une connexion (le navigateur se reconnecte
+# automatiquement). Un flux est une coroutine : les onglets ouverts
+# n'occupent aucun thread, contrairement à un flux servi par gunicorn.
+SSE_CHECK_INTERVAL = float(os.environ.get('SSE_CHECK_INTERVAL', '0.5'))
+SSE_MAX_DURATION = float(os.environ.get('SSE_MAX_DURATION', '300'))
+
+logger = logging.getLogger(__name__)
+
+_job_slots = None
+_tasks = set()
+
+metrics.REGISTRY.gauge('async_jobs', "Exports asyncio en cours ou en attente",
+                       callback=lambda: len(_tasks))
+
+
+def job_slots():
+    # Créé paresseusement : le sémaphore appartient à la boucle d'événements
+    global _job_slots
+    if _job_slots is None:
+        _job_slots = asyncio.Semaphore(ASYNC_MAX_JOBS)
+    return _job_slots
+
+
+async def walk_cursor_chain_async(client, address, api_params, since, on_page, cursor=None, max_pages=None,
+                                  on_checkpoint=None):
+    """Version asyncio de app.walk_cursor_chain (on_page et on_checkpoint sont des coroutines)"""
+    pages = 0
+    fetched_bytes = 0
+
+    while max_pages is None or pages < max_pages:
+        params = {'user': address, 'page_size': PAGE_SIZE}
+        params.update(api_params)
+        if since:
+            params['updated_min_timestamp'] = since
+        if cursor:
+            params['cursor'] = cursor
+
+        response = await client.get_assets(params)
+        pages += 1
+        fetched_bytes += response.wire_bytes
+
+        if response.status_code != 200:
+            raise wsgi.FetchError(f"Erreur API: {response.status_code}")
+
+        data = client.decode_assets(response)
+        batch = data.get('result')
+        cursor = (data.get('cursor') or None) if batch else None
+        if batch:
+            await on_page(batch)
+        if on_checkpoint:
+            await on_checkpoint(cursor, pages)
+
+        if not cursor:
+            return pages, fetched_bytes, None
+
+    return pages, fetched_bytes, cursor
+
+
+async def sync_wallet_async(address, on_progress=None, query=None, on_resume=None):
+    """Version asyncio de app.sync_wallet (mêmes règles de filtres, de partitions, d'instantané et de reprise)
+
+    Les requêtes API ne bloquent pas la boucle ; les accès SQLite à
+    l'instantané sont faits dans un thread. on_progress et on_resume sont
+    des coroutines.
+    """
+    if query is None:
+        query = ReportQuery()
+    client = async_fetch.get_async_client()
+    store = get_asset_store()
+    scope = wsgi.snapshot_scope(address, query)
+    since, full_sync, sync_started = await asyncio.to_thread(store.begin_sync, scope)
+    metrics.CACHE_LOOKUPS.inc(1, 'asset_snapshot', 'miss' if full_sync else 'hit')
+    checkpoints = await asyncio.to_thread(store.checkpoints, scope)
+    resumed_pages = sum(pages for _, pages, _ in checkpoints.values())
+    resumed_count = 0
+    if checkpoints:
+        metrics.FETCH_RESUMES.inc()
+        resumed_count = await asyncio.to_thread(store.count, scope, sync_started)
+        if on_resume:
+            await on_resume(max(pages for _, pages, _ in checkpoints.values()))
+    seen = set()
+
+    async def on_page(batch):
+        records = [record for record in wsgi.process_assets(batch) if query.matches(record)]
+        await asyncio.to_thread(store.upsert, scope, records, sync_started)
+        seen.update(asset.get('token_id') for asset in batch)
+        if on_progress:
+            await on_progress(resumed_count + len(seen))
+
+    async def walk(chain, api_params):
+        cursor, pages_done, done = checkpoints.get(chain, (None, 0, False))
+        if done:
+            return 0, 0, None
+
+        async def on_checkpoint(next_cursor, pages):
+            await asyncio.to_thread(store.save_checkpoint, scope, chain, next_cursor, pages_done + pages,
+                                    not next_cursor)
+        return await walk_cursor_chain_async(client, address, api_params, since, on_page, cursor,
+                                             on_checkpoint=on_checkpoint)
+
+    partitions = []
+    if wsgi.MAIN_CHAIN not in checkpoints:
+        known_count = await asyncio.to_thread(store.count, scope)
+        partitions = wsgi.fetch_partitions(query, since, known_count)
+    if partitions:
+        tasks = [asyncio.ensure_future(walk(partition.signature(), partition.api_params()))
+                 for partition in partitions]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            # Arrêter les autres chaînes : la reprise repartira de leurs points de reprise
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+    else:
+        results = [await walk(wsgi.MAIN_CHAIN, query.api_params())]
+    pages = sum(chain_pages for chain_pages, _, _ in results)
+    fetched_bytes = sum(chain_bytes for _, chain_bytes, _ in results)
+
+    await asyncio.to_thread(store.finish_sync, scope, sync_started, full_sync)
+    count = await asyncio.to_thread(store.count, scope)
+    stats = await asyncio.to_thread(wsgi.transfer_stats, address, count, pages, fetched_bytes, resumed_pages)
+    stats['resumed_pages'] = resumed_pages
+    stats['last_full_sync'] = await asyncio.to_thread(store.last_full_sync, scope)
+    return count, stats
+
+
+async def update_job(job_id, **fields):
+    """request_status.update_job hors de la boucle (le registre SQLite peut attendre son verrou)"""
+    await asyncio.to_thread(wsgi.request_status.update_job, job_id, **fields)
+
+
+async def process_address(address, query, job_id):
+    """Exporte une adresse : récupération asynchrone puis CSV (dans un thread)"""
+    # Wallet présent dans un index des propriétaires à jour : lecture locale, sans requête
+    records = await asyncio.to_thread(wsgi.indexed_wallet, address, query)
+    if records is not None:
+        await update_job(job_id, count=len(records), status='processing_complete', source='owner_index',
+                         pages_avoided=pages_for(len(records)), bytes_avoided=None)
+    else:
+        # Rappels de sync_wallet_async (coroutines) et de app.sync_wallet (appelés dans son thread)
+        on_progress = lambda total: update_job(job_id, count=total)
+        on_resume = lambda pages: update_job(job_id, resumed_from_page=pages)
+        on_progress_sync = lambda total: wsgi.request_status.update_job(job_id, count=total)
+        on_resume_sync = lambda pages: wsgi.request_status.update_job(job_id, resumed_from_page=pages)
+        async with job_slots():
+            await update_job(job_id, status='processing', source='api', last_full_sync=None)
+            attempt = 0
+            while True:
+                try:
+                    with metrics.STAGE_SECONDS.time('fetch'):
+                        if async_fetch.available():
+                            count, stats = await sync_wallet_async(address, on_progress, query, on_resume)
+                        else:
+                            count, stats = await asyncio.to_thread(wsgi.sync_wallet, address, on_progress_sync, query,
+                                                                   on_resume_sync)
+                    break
+                except Exception as e:
+                    if attempt < wsgi.FETCH_RESUME_RETRIES:
+                        # Reprise au dernier curseur enregistré (voir app.fetch_assets_for_address)
+                        attempt += 1
+                        logger.warning(f"{job_id}: {str(e)}, reprise au dernier curseur "
+                                       f"({attempt}/{wsgi.FETCH_RESUME_RETRIES})")
+                        await asyncio.sleep(wsgi.FETCH_RESUME_DELAY * attempt)
+                        continue
+                    logger.error(f"Erreur lors de la récupération des NFTs: {str(e)}")
+                    await update_job(job_id, status='error', error=str(e))
+                    return
+
+        await update_job(job_id, count=count, status='processing_complete',
+                         pages_avoided=stats['pages_avoided'], bytes_avoided=stats['bytes_avoided'],
+                         last_full_sync=stats['last_full_sync'])
+
+    def build_csv():
+        if records is None:
+            counts = wsgi.aggregate_assets(get_asset_store().iter_processed(wsgi.snapshot_scope(address, query)))
+        else:
+            counts = wsgi.aggregate_assets(records)
+        if not counts:
+            return None
+        csv_content = wsgi.write_csv(counts).encode('utf-8')
+        wsgi.save_card_catalog()
+        return csv_content
+
+    csv_content = await asyncio.to_thread(build_csv)
+    if csv_content:
+        await update_job(job_id, csv_content=csv_content, result_hash=result_cache.content_hash(csv_content),
+                         status='complete')
+    else:
+        await update_job(job_id, status='error', error="Aucun NFT trouvé")
+
+
+async def run_job(address, query, job_id):
+    """Exécute process_address : toute exception passe la tâche en erreur (voir app.run_job)"""
+    try:
+        await process_address(address, query, job_id)
+    except Exception as e:
+        logger.exception(f"{job_id}: erreur inattendue")
+        await update_job(job_id, status='error', error=str(e))
+
+
+def start_job(address, query, job_id):
+    """Lance l'export dans la boucle en gardant une référence sur la tâche"""
+    task = asyncio.get_running_loop().create_task(run_job(address, query, job_id))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+# Réponses HTTP
+
+async def send_response(send, status, body, content_type, headers=None):
+    raw_headers = [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())]
+    for name, value in (headers or {}).items():
+        raw_headers.append((name.lower().encode(), value.encode()))
+    await send({'type': 'http.response.start', 'status': status, 'headers': raw_headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def send_json(send, data, status=200):
+    await send_response(send, status, json.dumps(data).encode(), 'application/json')
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def query_args(scope):
+    return dict(parse_qsl(scope.get('query_string', b'').decode()))
+
+
+def job_key(scope):
+    """Identifiant de tâche (paramètre address) normalisé, None si absent"""
+    address = query_args(scope).get('address')
+    return wsgi.normalize_address(address) if address else None
+
+
+# Routes
+
+async def index(scope, receive, send):
+    html = wsgi.app.jinja_env.get_template('index.html').render(events_enabled=True)
+    await send_response(send, 200, html.encode('utf-8'), 'text/html; charset=utf-8')
+
+
+async def process(scope, receive, send):
+    form = dict(parse_qsl((await read_body(receive)).decode()))
+    try:
+        address, query, job_id = wsgi.parse_process_form(form)
+    except ValueError as e:
+        await send_json(send, {'error': str(e)}, 400)
+        return
+
+    # Registre (éventuellement SQLite) consulté hors de la boucle
+    job = await asyncio.to_thread(wsgi.request_status.claim, job_id, {
+        'status': 'queued',
+        'count': 0,
+        'error': None,
+        'requests': 1,
+        'resumed_from_page': 0
+    })
+    if job is not None:
+        metrics.JOBS_DEDUPLICATED.inc(1, 'process')
+        await send_json(send, {'message': 'Traitement déjà en cours', 'address': job_id})
+        return
+    start_job(address, query, job_id)
+    await send_json(send, {'message': 'Traitement démarré', 'address': job_id, 'queue_position': 0})
+
+
+async def status(scope, receive, send):
+    address = job_key(scope)
+    if not address:
+        await send_json(send, {'error': 'Adresse non fournie'}, 400)
+        return
+
+    snapshot = await asyncio.to_thread(wsgi.job_snapshot, address)
+    if snapshot is None:
+        await send_json(send, {'error': 'Aucun traitement en cours pour cette adresse'}, 404)
+        return
+    await send_json(send, snapshot)
+
+
+async def events(scope, receive, send):
+    """Flux Server-Sent Events : un message à chaque changement d'état de la tâche"""
+    address = job_key(scope)
+    if not address:
+        await send_json(send, {'error': 'Adresse non fournie'}, 400)
+        return
+    if not await asyncio.to_thread(wsgi.request_status.__contains__, address):
+        await send_json(send, {'error': 'Aucun traitement en cours pour cette adresse'}, 404)
+        return
+
+    disconnected = asyncio.Event()
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no')
+    ]})
+    try:
+        await send({'type': 'http.response.body', 'body': b'retry: 1000\n\n', 'more_body': True})
+        last = None
+        deadline = asyncio.get_running_loop().time() + SSE_MAX_DURATION
+        while not disconnected.is_set() and asyncio.get_running_loop().time() < deadline:
+            snapshot = await asyncio.to_thread(wsgi.job_snapshot, address)
+            if snapshot is None:
+                snapshot = {'status': 'error', 'count': 0, 'error': 'Tâche expirée', 'queue_position': 0}
+            if snapshot != last:
+                message = f"data: {json.dumps(snapshot)}\n\n".encode()
+                await send({'type': 'http.response.body', 'body': message, 'more_body': True})
+                last = snapshot
+            if snapshot['status'] in ('complete', 'error'):
+                break
+            try:
+                await asyncio.wait_for(disconnected.wait(), SSE_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        if not disconnected.is_set():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        watcher.cancel()
+
+
+async def download(scope, receive, send):
+    address = job_key(scope)
+    if not address:
+        await send_json(send, {'error': 'Adresse non fournie'}, 400)
+        return
+
+    request_headers = {name.decode('latin-1').lower(): value.decode('latin-1') for name, value in scope['headers']}
+    # Lecture du registre, conversion et compression éventuelles hors de la boucle
+    status_code, body, headers = await asyncio.to_thread(
+        wsgi.prepare_download, address, query_args(scope).get('format', 'csv'),
+        request_headers.get('accept-encoding'), request_headers.get('if-none-match'))
+    if isinstance(body, dict):
+        await send_json(send, body, status_code)
+        return
+
+    raw_headers = [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+    await send({'type': 'http.response.start', 'status': status_code, 'headers': raw_headers})
+    if body is None:
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    # Envoyer le contenu par morceaux, sans le recopier en entier
+    view = memoryview(body)
+    size = wsgi.DOWNLOAD_CHUNK_SIZE
+    for start in range(0, len(view), size):
+        end = start + size
+        await send({'type': 'http.response.body', 'body': view[start:end].tobytes(), 'more_body': end < len(view)})
+    if not view:
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+async def metrics_endpoint(scope, receive, send):
+    await send_response(send, 200, metrics.render().encode('utf-8'), metrics.CONTENT_TYPE)
+
+
+ROUTES = {
+    ('GET', '/'): index,
+    ('POST', '/process'): process,
+    ('POST', '/get_nfts'): process,
+    ('GET', '/status'): status,
+    ('GET', '/events'): events,
+    ('GET', '/download'): download,
+    ('GET', '/metrics'): metrics_endpoint
+}
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await async_fetch.close_async_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """Application ASGI"""
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        await send_json(send, {'error': 'Route inconnue'}, 404)
+        return
+    await handler(scope, receive, send)
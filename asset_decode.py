@@ -0,0 +1,93 @@
+import os
+import json
+from typing import Any, List, Optional, TypedDict
+
+try:
+    import msgspec
+except ImportError:  # msgspec est optionnel
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # orjson est optionnel
+    orjson = None
+
+# Décodage des pages /v1/assets
+# Avec msgspec, seuls les champs lus par process_assets sont construits en
+# objets Python (métadonnées de la carte, token_id, token_address,
+# updated_at, nom de la collection, ainsi que user et status pour
+# owner_index) : images, frais, ordres, etc. sont parcourus sans être
+# alloués. Le résultat garde la forme des dicts de l'API. Sans msgspec, la
+# page est décodée entièrement avec orjson s'il est installé, sinon avec
+# json.
+# JSON_DECODER force un décodeur : 'auto', 'msgspec', 'orjson' ou 'json'.
+
+JSON_DECODER = os.environ.get('JSON_DECODER', 'auto')
+
+
+class AssetMetadata(TypedDict, total=False):
+    name: Any
+    rarity: Any
+    element: Any
+    advancement: Any
+    faction: Any
+    grade: Any
+    foil: Any
+
+
+class AssetCollection(TypedDict, total=False):
+    name: Any
+
+
+class Asset(TypedDict, total=False):
+    token_id: Any
+    token_address: Any
+    updated_at: Any
+    user: Any
+    status: Any
+    metadata: Optional[AssetMetadata]
+    collection: Optional[AssetCollection]
+
+
+class AssetPage(TypedDict, total=False):
+    result: Optional[List[Asset]]
+    cursor: Any
+    remaining: Any
+
+
+_page_decoder = msgspec.json.Decoder(AssetPage) if msgspec is not None else None
+
+
+def available_decoders():
+    """Décodeurs utilisables dans ce processus, du plus rapide au plus lent"""
+    decoders = []
+    if msgspec is not None:
+        decoders.append('msgspec')
+    if orjson is not None:
+        decoders.append('orjson')
+    decoders.append('json')
+    return decoders
+
+
+def default_decoder():
+    """Décodeur retenu pour JSON_DECODER"""
+    if JSON_DECODER == 'auto':
+        return available_decoders()[0]
+    if JSON_DECODER not in available_decoders():
+        raise ValueError(f"Décodeur JSON indisponible: {JSON_DECODER}")
+    return JSON_DECODER
+
+
+def decode_page(content, decoder=None):
+    """Décode une page /v1/assets (octets JSON) en dict {'result': [...], 'cursor': ...}"""
+    decoder = decoder or default_decoder()
+    if decoder == 'msgspec':
+        try:
+            return _page_decoder.decode(content)
+        except msgspec.ValidationError:
+            # Structure inattendue (ex. result n'est pas une liste) : décodage complet
+            pass
+        decoder = 'orjson' if orjson is not None else 'json'
+    if decoder == 'orjson':
+        return orjson.loads(content)
+    return json.loads(content)
@@ -0,0 +1,214 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone, timedelta
+
+from records import CardRecord
+
+# Instantané local (SQLite) des NFTs de chaque adresse
+# Seuls les champs utilisés par process_assets sont conservés, indexés par
+# token_id. Une nouvelle exportation ne demande à ImmutableX que les NFTs
+# modifiés depuis la dernière synchronisation (updated_min_timestamp).
+# Les NFTs transférés hors du wallet n'apparaissent pas dans ces deltas : une
+# resynchronisation complète est donc forcée au-delà de ASSET_FULL_SYNC_AGE.
+# Jusque-là, un NFT vendu peut encore être compté ; la date de la dernière
+# synchronisation complète (last_full_sync) est affichée avec le rapport.
+# Une synchronisation en cours enregistre après chaque page le curseur de la
+# page suivante de chaque chaîne de curseurs : si elle échoue, la suivante la
+# reprend à ces points de reprise (mêmes since et started) au lieu de tout
+# redemander.
+
+ASSET_DB_PATH = os.environ.get('ASSET_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets.db'))
+ASSET_FULL_SYNC_AGE = int(os.environ.get('ASSET_FULL_SYNC_AGE', '86400'))
+
+# Marge appliquée au timestamp de synchronisation (décalage d'horloge avec l'API)
+SYNC_MARGIN = timedelta(seconds=60)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    address TEXT NOT NULL,
+    token_id TEXT NOT NULL,
+    name TEXT,
+    rarity TEXT,
+    element TEXT,
+    advancement TEXT,
+    faction TEXT,
+    grade TEXT,
+    is_foil INTEGER,
+    updated_at TEXT,
+    seen_at REAL,
+    PRIMARY KEY (address, token_id)
+);
+CREATE TABLE IF NOT EXISTS syncs (
+    address TEXT PRIMARY KEY,
+    last_sync TEXT NOT NULL,
+    last_full_sync REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending_syncs (
+    address TEXT PRIMARY KEY,
+    since TEXT,
+    full INTEGER NOT NULL,
+    started REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sync_checkpoints (
+    address TEXT NOT NULL,
+    chain TEXT NOT NULL,
+    cursor TEXT,
+    pages INTEGER NOT NULL,
+    done INTEGER NOT NULL,
+    PRIMARY KEY (address, chain)
+);
+"""
+
+
+def _utc_iso(dt):
+    return dt.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class AssetStore:
+    """Stockage SQLite des NFTs par adresse avec synchronisation incrémentale"""
+
+    def __init__(self, path=ASSET_DB_PATH, full_sync_age=ASSET_FULL_SYNC_AGE):
+        self.path = path
+        self.full_sync_age = full_sync_age
+        with self._transaction() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # Une connexion par opération : l'instantané est partagé entre threads
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def begin_sync(self, address):
+        """Prépare une synchronisation, ou reprend celle qui a été interrompue
+
+        Retourne (since, full, started) : since est le timestamp à passer en
+        updated_min_timestamp (None pour une synchronisation complète). Une
+        synchronisation interrompue depuis moins de full_sync_age est reprise
+        avec ses valeurs ; ses points de reprise sont donnés par checkpoints().
+        """
+        address = address.lower()
+        started = time.time()
+        with self._transaction() as conn:
+            pending = conn.execute(
+                'SELECT since, full, started FROM pending_syncs WHERE address = ?', (address,)
+            ).fetchone()
+            if pending is not None and started - pending[2] <= self.full_sync_age:
+                return pending[0], bool(pending[1]), pending[2]
+
+            row = conn.execute(
+                'SELECT last_sync, last_full_sync FROM syncs WHERE address = ?', (address,)
+            ).fetchone()
+            if row is None or started - row[1] > self.full_sync_age:
+                since, full = None, True
+            else:
+                since, full = row[0], False
+            conn.execute('DELETE FROM sync_checkpoints WHERE address = ?', (address,))
+            conn.execute(
+                'INSERT OR REPLACE INTO pending_syncs (address, since, full, started) VALUES (?, ?, ?, ?)',
+                (address, since, int(full), started)
+            )
+        return since, full, started
+
+    def checkpoints(self, address):
+        """Points de reprise de la synchronisation en cours : {chaîne: (curseur, pages, terminée)}"""
+        with self._transaction() as conn:
+            rows = conn.execute(
+                'SELECT chain, cursor, pages, done FROM sync_checkpoints WHERE address = ?', (address.lower(),)
+            ).fetchall()
+        return {chain: (cursor, pages, bool(done)) for chain, cursor, pages, done in rows}
+
+    def save_checkpoint(self, address, chain, cursor, pages, done=False):
+        """Enregistre le curseur de la prochaine page d'une chaîne (après l'enregistrement de la page)"""
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO sync_checkpoints (address, chain, cursor, pages, done) VALUES (?, ?, ?, ?, ?)',
+                (address.lower(), chain, cursor, pages, int(done))
+            )
+
+    def upsert(self, address, processed_data, seen_at):
+        """Insère ou met à jour les NFTs traités (CardRecord avec token_id)"""
+        address = address.lower()
+        rows = [
+            (address, item.token_id, item.name, item.rarity, item.element,
+             item.advancement, item.faction, item.grade, int(bool(item.is_foil)),
+             item.updated_at, seen_at)
+            for item in processed_data
+        ]
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO assets (address, token_id, name, rarity, element, advancement, '
+                'faction, grade, is_foil, updated_at, seen_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def finish_sync(self, address, started, full):
+        """Enregistre une synchronisation réussie
+
+        Pour une synchronisation complète, les NFTs non revus sont supprimés.
+        """
+        address = address.lower()
+        since = _utc_iso(datetime.fromtimestamp(started, timezone.utc) - SYNC_MARGIN)
+        with self._transaction() as conn:
+            if full:
+                conn.execute('DELETE FROM assets WHERE address = ? AND seen_at < ?', (address, started))
+                conn.execute(
+                    'INSERT OR REPLACE INTO syncs (address, last_sync, last_full_sync) VALUES (?, ?, ?)',
+                    (address, since, started)
+                )
+            else:
+                conn.execute('UPDATE syncs SET last_sync = ? WHERE address = ?', (since, address))
+            conn.execute('DELETE FROM pending_syncs WHERE address = ?', (address,))
+            conn.execute('DELETE FROM sync_checkpoints WHERE address = ?', (address,))
+
+    def last_full_sync(self, address):
+        """Timestamp de la dernière synchronisation complète réussie (None si jamais synchronisée)"""
+        with self._transaction() as conn:
+            row = conn.execute('SELECT last_full_sync FROM syncs WHERE address = ?', (address.lower(),)).fetchone()
+        return row[0] if row else None
+
+    def iter_processed(self, address):
+        """Parcourt les NFTs stockés au format de process_assets"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                'SELECT name, rarity, element, advancement, faction, grade, is_foil '
+                'FROM assets WHERE address = ? ORDER BY rowid', (address.lower(),)
+            )
+            for name, rarity, element, advancement, faction, grade, is_foil in cursor:
+                yield CardRecord(name, rarity, element, advancement, faction, grade, bool(is_foil))
+        finally:
+            conn.close()
+
+    def count(self, address, seen_since=None):
+        """Nombre de NFTs stockés pour une adresse (revus depuis seen_since si indiqué)"""
+        with self._transaction() as conn:
+            if seen_since is not None:
+                return conn.execute('SELECT COUNT(*) FROM assets WHERE address = ? AND seen_at >= ?',
+                                    (address.lower(), seen_since)).fetchone()[0]
+            return conn.execute('SELECT COUNT(*) FROM assets WHERE address = ?', (address.lower(),)).fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_asset_store():
+    """Retourne l'instantané partagé du processus (créé au premier appel)"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AssetStore()
+        return _store
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import zlib
+import asyncio
+import logging
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp est optionnel
+    aiohttp = None
+
+from imx_client import IMX_API_URL, DEFAULT_HEADERS, get_client
+import metrics
+import asset_decode
+
+# Client ImmutableX asyncio (aiohttp, optionnel)
+# Une coroutine par export au lieu d'un thread bloqué sur le réseau : un seul
+# processus peut mener des milliers de paginations en parallèle. Le limiteur
+# de débit est celui du client synchrone partagé, si bien que les exports
+# WSGI et ASGI d'un même processus consomment le même budget de requêtes.
+
+# Connexions simultanées maximales vers l'API
+ASYNC_POOL_SIZE = int(os.environ.get('ASYNC_POOL_SIZE', '100'))
+
+logger = logging.getLogger(__name__)
+
+
+def available():
+    """Indique si aiohttp est installé"""
+    return aiohttp is not None
+
+
+class AsyncResponse:
+    """Réponse lue entièrement, avec la même interface que celles du client synchrone"""
+
+    def __init__(self, status_code, headers, content, wire_bytes):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.wire_bytes = wire_bytes
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncImxClient:
+    """Session aiohttp poolée vers l'API ImmutableX"""
+
+    def __init__(self, base_url=IMX_API_URL, pool_size=ASYNC_POOL_SIZE, connect_timeout=5, read_timeout=30,
+                 limiter=None, max_retries=3):
+        self.base_url = base_url.rstrip('/')
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.limiter = limiter if limiter is not None else get_client().limiter
+        self.max_retries = max_retries
+        self._session = None
+        self._loop = None
+
+    def _ensure_session(self):
+        # La session doit être créée dans la boucle d'événements qui l'utilise
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed or self._loop is not loop:
+            self._loop = loop
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+                headers=DEFAULT_HEADERS,
+                # Décompression faite ici pour connaître la taille transférée
+                auto_decompress=False
+            )
+        return self._session
+
+    async def get(self, path, params=None):
+        """GET asynchrone sur l'API, avec limiteur de débit et rejeu des 429"""
+        session = self._ensure_session()
+        for attempt in range(self.max_retries + 1):
+            waited = await self.limiter.acquire_async()
+            if waited:
+                metrics.IMX_RATE_WAIT_SECONDS.inc(waited)
+            started = time.monotonic()
+            async with session.get(f"{self.base_url}{path}", params=params) as response:
+                raw = await response.read()
+                status_code = response.status
+                headers = response.headers
+            elapsed = time.monotonic() - started
+            self.limiter.update(status_code, headers)
+            metrics.IMX_REQUESTS.inc(1, status_code)
+            metrics.IMX_REQUEST_SECONDS.observe(elapsed)
+            if status_code != 429:
+                break
+            logger.warning("429 reçu de l'API (tentative %d)", attempt + 1)
+        content = raw
+        if headers.get('Content-Encoding', '').lower() == 'gzip':
+            content = zlib.decompress(raw, 16 + zlib.MAX_WBITS)
+        metrics.IMX_BYTES.inc(len(raw), 'wire')
+        metrics.IMX_BYTES.inc(len(content), 'decoded')
+        return AsyncResponse(status_code, headers, content, len(raw))
+
+    def decode(self, response):
+        """Décode le corps JSON d'une réponse en mesurant la durée du décodage"""
+        with metrics.IMX_DECODE_SECONDS.time('json'):
+            return response.json()
+
+    def decode_assets(self, response):
+        """Décode une page /v1/assets en ne gardant que les champs utiles (voir asset_decode)"""
+        decoder = asset_decode.default_decoder()
+        with metrics.IMX_DECODE_SECONDS.time(decoder):
+            return asset_decode.decode_page(response.content, decoder)
+
+    async def get_assets(self, params):
+        """Récupère une page de /v1/assets"""
+        return await self.get('/v1/assets', params)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+_client = None
+
+
+def get_async_client():
+    """Retourne le client asynchrone du processus (créé au premier appel)"""
+    global _client
+    if _client is None:
+        _client = AsyncImxClient()
+    return _client
+
+
+async def close_async_client():
+    """Ferme la session du client asynchrone (arrêt du serveur ASGI)"""
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
@@ -0,0 +1 @@
+"""Benchmarks reproductibles : wallets synthétiques et serveur ImmutableX local"""
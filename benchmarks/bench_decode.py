@@ -0,0 +1,78 @@
+"""Décodage d'une page /v1/assets : json.loads complet vs décodeurs de asset_decode
+
+Usage : python benchmarks/bench_decode.py [nfts_par_page] [répétitions]
+Affiche un résultat JSON (durée médiane par page, mémoire allouée au pic et
+conservée après décodage, pour chaque décodeur installé).
+"""
+import gc
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import asset_decode
+from benchmarks.synthetic import generate_assets
+
+
+def synthetic_page(size):
+    """Page encodée comme l'API la renvoie (octets JSON)"""
+    return json.dumps({'result': generate_assets(size), 'cursor': 'c3RvcA==', 'remaining': 1}).encode()
+
+
+def measure_time(decode, content, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        decode(content)
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings)
+
+
+def measure_memory(decode, content):
+    gc.collect()
+    tracemalloc.start()
+    page = decode(content)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del page
+    return peak, retained
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    content = synthetic_page(size)
+
+    decoders = {'baseline_json_full': json.loads}
+    for name in asset_decode.available_decoders():
+        decoders[name] = lambda content, name=name: asset_decode.decode_page(content, name)
+
+    results = {}
+    for name, decode in decoders.items():
+        seconds = measure_time(decode, content, repeat)
+        peak, retained = measure_memory(decode, content)
+        results[name] = {
+            'ms_per_page': round(seconds * 1000, 3),
+            'peak_bytes': peak,
+            'retained_bytes': retained
+        }
+
+    baseline = results['baseline_json_full']
+    for result in results.values():
+        result['speedup'] = round(baseline['ms_per_page'] / result['ms_per_page'], 2)
+        result['retained_ratio'] = round(result['retained_bytes'] / baseline['retained_bytes'], 3)
+
+    print(json.dumps({
+        'benchmark': 'decode',
+        'assets_per_page': size,
+        'page_bytes': len(content),
+        'results': results
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""Mesure mémoire : dicts par NFT vs CardRecord internés sur un wallet synthétique
+
+Usage : python benchmarks/bench_records_memory.py [nombre_de_nfts]
+Affiche un résultat JSON (octets alloués par représentation et gain).
+"""
+import json
+import random
+import sys
+import os
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from records import CardRecord
+
+RARITIES = ['COMMON', 'UNCOMMON', 'RARE', 'SPECIAL_RARE', 'ULTRA_RARE', 'MYTHIC', 'EXCLUSIVE']
+ELEMENTS = ['FIRE', 'WATER', 'EARTH', 'AIR', 'NEUTRAL']
+ADVANCEMENTS = ['STANDARD', 'ALTERNATIVE', 'COMBO']
+FACTIONS = ['HUMAN', 'SPIRIT', 'CORRUPTION', 'NEUTRAL']
+GRADES = ['', 'C', 'B', 'A', 'S']
+
+
+def synthetic_metadata(count, seed=0):
+    """Métadonnées aléatoires telles que décodées du JSON (chaînes non partagées)"""
+    rng = random.Random(seed)
+    for i in range(count):
+        # Reconstruire les chaînes comme le ferait json.loads : une copie par NFT
+        yield {
+            'token_id': str(i),
+            'name': ''.join(['Carte ', str(rng.randrange(300))]),
+            'rarity': ''.join(rng.choice(RARITIES)),
+            'element': ''.join(rng.choice(ELEMENTS)),
+            'advancement': ''.join(rng.choice(ADVANCEMENTS)),
+            'faction': ''.join(rng.choice(FACTIONS)),
+            'grade': ''.join(rng.choice(GRADES)),
+            'foil': rng.random() < 0.1
+        }
+
+
+def measure(build, count):
+    tracemalloc.start()
+    data = build(synthetic_metadata(count))
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return current
+
+
+def build_dicts(metadata):
+    return [{
+        'token_id': m['token_id'],
+        'name': m['name'],
+        'rarity': m['rarity'],
+        'element': m['element'],
+        'advancement': m['advancement'],
+        'faction': m['faction'],
+        'grade': m['grade'],
+        'is_foil': m['foil']
+    } for m in metadata]
+
+
+def build_records(metadata):
+    return [CardRecord(
+        m['name'], m['rarity'], m['element'], m['advancement'], m['faction'], m['grade'], m['foil'],
+        token_id=m['token_id']
+    ) for m in metadata]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    dict_bytes = measure(build_dicts, count)
+    record_bytes = measure(build_records, count)
+    print(json.dumps({
+        'benchmark': 'records_memory',
+        'assets': count,
+        'dict_bytes': dict_bytes,
+        'record_bytes': record_bytes,
+        'dict_bytes_per_asset': round(dict_bytes / count, 1),
+        'record_bytes_per_asset': round(record_bytes / count, 1),
+        'saving_ratio': round(1 - record_bytes / dict_bytes, 3)
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""Suite de benchmarks : récupération, process_assets, generate_csv et bout en bout
+
+Chaque version de l'application (racine, cta-to-csv, focus-version) est
+chargée contre le serveur ImmutableX local (benchmarks.stub_server) et
+mesurée sur des wallets synthétiques de plusieurs tailles. Les résultats sont
+écrits en JSON pour être comparés d'une exécution à l'autre.
+
+Usage : python -m benchmarks.run --sizes 10,1000,10000 --output resultats.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VARIANTS = {
+    'root': {
+        'path': os.path.join(ROOT, 'app.py'),
+        'process': ('POST', '/process'),
+        'status': '/status',
+        'download': '/download'
+    },
+    'cta-to-csv': {
+        'path': os.path.join(ROOT, 'cta-to-csv', 'app.py'),
+        'process': ('GET', '/process'),
+        'status': '/api/status',
+        'download': '/api/download'
+    },
+    'focus-version': {
+        'path': os.path.join(ROOT, 'cta-to-csv', 'focus-version', 'app.py'),
+        'process': ('POST', '/process'),
+        'status': '/status',
+        'download': '/download'
+    }
+}
+
+# Durée maximale d'un traitement bout en bout avant abandon (secondes)
+E2E_TIMEOUT = 600
+
+
+def wallet_address(size):
+    """Adresse synthétique propre à chaque taille de wallet"""
+    return '0x' + f'{size:040x}'
+
+
+def load_variant(name):
+    """Importe le module app.py d'une version sous un nom unique"""
+    spec = importlib.util.spec_from_file_location(f'bench_app_{name.replace("-", "_")}', VARIANTS[name]['path'])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def timed(func, repeat):
+    """Exécute func repeat fois ; retourne (dernier résultat, durées)"""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        durations.append(time.perf_counter() - started)
+    return result, durations
+
+
+def summary(durations):
+    return {
+        'runs': len(durations),
+        'min_s': round(min(durations), 6),
+        'median_s': round(statistics.median(durations), 6)
+    }
+
+
+def reset_snapshot(tmpdir):
+    """Instantané local vierge : la version racine refait une synchronisation complète"""
+    import asset_store
+    asset_store._store = asset_store.AssetStore(path=tempfile.mktemp(suffix='.db', dir=tmpdir))
+
+
+def bench_fetch(name, module, address, tmpdir):
+    if name == 'root':
+        reset_snapshot(tmpdir)
+        counts = module.fetch_assets_for_address(address)
+        return sum(module.card_total(grades) for grades in counts.values())
+    module.processing_status[address] = {'status': 'processing', 'count': 0, 'error': '', 'result': ''}
+    status, assets = module.fetch_assets_for_address(address)
+    return len(assets)
+
+
+def bench_end_to_end(name, module, address, tmpdir):
+    variant = VARIANTS[name]
+    # Oublier l'état laissé par bench_fetch (sinon /process se rattache au
+    # traitement « en cours » qu'il a laissé et le statut n'évolue plus)
+    if name == 'root':
+        reset_snapshot(tmpdir)
+        module.request_status.pop(address, None)
+    else:
+        module.processing_status.pop(address, None)
+    client = module.app.test_client()
+    method, path = variant['process']
+    if method == 'POST':
+        client.post(path, data={'address': address})
+    else:
+        client.get(path, query_string={'address': address})
+    deadline = time.monotonic() + E2E_TIMEOUT
+    while True:
+        status = client.get(variant['status'], query_string={'address': address}).get_json()
+        if status.get('status') in ('complete', 'error') or (status.get('error') and not status.get('status')):
+            break
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{name}: traitement non terminé après {E2E_TIMEOUT}s ({status})")
+        time.sleep(0.01)
+    response = client.get(variant['download'], query_string={'address': address})
+    return len(response.get_data())
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks des trois versions de l'application")
+    parser.add_argument('--sizes', default='10,1000,10000', help="Tailles de wallets (ex: 10,1000,100000)")
+    parser.add_argument('--variants', default=','.join(VARIANTS), help="Versions à mesurer")
+    parser.add_argument('--benchmarks', default='fetch,process_assets,generate_csv,end_to_end')
+    parser.add_argument('--repeat', type=int, default=3, help="Répétitions des mesures CPU")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latence du serveur local (secondes)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Proportion de requêtes en erreur")
+    parser.add_argument('--output', help="Fichier JSON de sortie (stdout par défaut)")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    variants = args.variants.split(',')
+    benchmarks = args.benchmarks.split(',')
+
+    tmpdir = tempfile.mkdtemp(prefix='cta-bench-')
+    sys.path.insert(0, ROOT)
+    from benchmarks.stub_server import StubServer
+    from benchmarks.synthetic import generate_assets
+
+    server = StubServer(latency=args.latency, error_rate=args.error_rate, error_status=429).start()
+    # Configuration lue à l'import des modules partagés : serveur local, pas de
+    # limitation de débit, registres, instantanés et catalogue de cartes dans
+    # un dossier temporaire (les cartes synthétiques n'entrent pas dans le
+    # vrai catalogue). L'index des propriétaires n'y existe pas : la version
+    # racine récupère réellement les NFTs au lieu de lire un owners.db local.
+    os.environ['IMX_API_URL'] = server.url
+    os.environ.setdefault('IMX_RATE_LIMIT', '1000')
+    os.environ.setdefault('IMX_RATE_MAX', '1000')
+    os.environ.setdefault('IMX_RATE_BURST', '1000')
+    os.environ['ASSET_DB_PATH'] = os.path.join(tmpdir, 'assets.db')
+    os.environ['JOB_STORE_PATH'] = os.path.join(tmpdir, 'jobs.db')
+    os.environ['CARD_CATALOG_PATH'] = os.path.join(tmpdir, 'cards.json')
+    os.environ['OWNER_INDEX_PATH'] = os.path.join(tmpdir, 'owners.db')
+
+    modules = {name: load_variant(name) for name in variants}
+    results = []
+
+    try:
+        for size in sizes:
+            address = wallet_address(size)
+            assets = generate_assets(size, owner=address)
+            server.state.add_wallet(address, assets)
+
+            for name, module in modules.items():
+                def record(benchmark, durations, **extra):
+                    entry = {'variant': name, 'benchmark': benchmark, 'size': size}
+                    entry.update(summary(durations))
+                    entry.update(extra)
+                    results.append(entry)
+                    print(f"{name:14} {benchmark:14} {size:>7} {entry['median_s']:.4f}s", file=sys.stderr, flush=True)
+
+                if 'fetch' in benchmarks:
+                    before = server.state.requests
+                    count, durations = timed(lambda: bench_fetch(name, module, address, tmpdir), 1)
+                    record('fetch', durations, assets_returned=count, requests=server.state.requests - before)
+
+                processed = module.process_assets(assets)
+                if 'process_assets' in benchmarks:
+                    _, durations = timed(lambda: module.process_assets(assets), args.repeat)
+                    record('process_assets', durations)
+
+                if 'generate_csv' in benchmarks:
+                    csv_content, durations = timed(lambda: module.generate_csv(processed), args.repeat)
+                    record('generate_csv', durations, csv_bytes=len(csv_content.encode('utf-8')))
+
+                if 'end_to_end' in benchmarks:
+                    before = server.state.requests
+                    downloaded, durations = timed(lambda: bench_end_to_end(name, module, address, tmpdir), 1)
+                    record('end_to_end', durations, download_bytes=downloaded, requests=server.state.requests - before)
+    finally:
+        server.stop()
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'git_revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'latency': args.latency,
+            'error_rate': args.error_rate,
+            'repeat': args.repeat
+        },
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
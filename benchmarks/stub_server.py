@@ -0,0 +1,186 @@
+"""Serveur HTTP local imitant GET /v1/assets d'ImmutableX
+
+Pagination par curseur, filtres user / metadata / updated_min_timestamp,
+gzip, latence et taux d'erreur configurables. Le filtre collection est
+ignoré : chaque wallet est servi quelle que soit la collection demandée, pour
+pouvoir comparer les trois versions de l'application sur les mêmes données.
+Sans filtre user, les NFTs de tous les wallets sont listés (parcours de la
+collection par owner_indexer.py).
+
+Usage : python -m benchmarks.stub_server --port 8765 --assets 10000
+"""
+import argparse
+import base64
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from benchmarks.synthetic import generate_assets
+
+
+def _encode_cursor(offset):
+    return base64.urlsafe_b64encode(str(offset).encode()).decode()
+
+
+def _decode_cursor(cursor):
+    return int(base64.urlsafe_b64decode(cursor.encode()).decode())
+
+
+def _matches_metadata(asset, metadata_filter):
+    metadata = asset['metadata']
+    for field, values in metadata_filter.items():
+        value = metadata.get(field)
+        if isinstance(value, bool):
+            value = 'true' if value else 'false'
+        if value not in values:
+            return False
+    return True
+
+
+class StubState:
+    """Wallets servis et compteurs de requêtes"""
+
+    def __init__(self, wallets=None, latency=0.0, error_rate=0.0, error_status=500, seed=0):
+        self.wallets = {address.lower(): assets for address, assets in (wallets or {}).items()}
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes_sent = 0
+        self._cache = {}
+
+    def add_wallet(self, address, assets):
+        with self.lock:
+            self.wallets[address.lower()] = assets
+            self._cache.clear()
+
+    def select(self, user, metadata, updated_min):
+        """Liste filtrée (mise en cache : chaque page ne refiltre pas tout le wallet)"""
+        key = (user, metadata, updated_min)
+        with self.lock:
+            if key not in self._cache:
+                if user:
+                    assets = self.wallets.get(user, [])
+                else:
+                    assets = [asset for wallet in self.wallets.values() for asset in wallet]
+                if metadata:
+                    metadata_filter = json.loads(metadata)
+                    assets = [a for a in assets if _matches_metadata(a, metadata_filter)]
+                if updated_min:
+                    assets = [a for a in assets if a['updated_at'] >= updated_min]
+                self._cache[key] = assets
+            return self._cache[key]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        use_gzip = 'gzip' in self.headers.get('Accept-Encoding', '')
+        if use_gzip:
+            body = gzip.compress(body, compresslevel=5)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if use_gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.state.lock:
+            self.state.requests += 1
+            self.state.bytes_sent += len(body)
+
+    def do_GET(self):
+        state = self.state
+        url = urlparse(self.path)
+        if url.path != '/v1/assets':
+            self._send(404, b'{"message":"not found"}')
+            return
+        if state.latency:
+            time.sleep(state.latency)
+        with state.lock:
+            fail = state.error_rate and state.rng.random() < state.error_rate
+        if fail:
+            headers = {'Retry-After': '0.1'} if state.error_status == 429 else None
+            self._send(state.error_status, b'{"message":"error"}', headers)
+            return
+
+        query = parse_qs(url.query)
+        user = query.get('user', [''])[0].lower()
+        page_size = min(int(query.get('page_size', ['100'])[0]), 200)
+        offset = _decode_cursor(query['cursor'][0]) if 'cursor' in query else 0
+        assets = state.select(user, query.get('metadata', [''])[0], query.get('updated_min_timestamp', [''])[0])
+
+        page = assets[offset:offset + page_size]
+        next_offset = offset + page_size
+        remaining = next_offset < len(assets)
+        body = json.dumps({
+            'result': page,
+            'cursor': _encode_cursor(next_offset) if remaining else '',
+            'remaining': 1 if remaining else 0
+        }).encode()
+        self._send(200, body)
+
+
+class StubServer:
+    """Serveur de test démarré dans un thread (utilisable en context manager)"""
+
+    def __init__(self, port=0, **state_options):
+        self.state = StubState(**state_options)
+        handler = type('BoundStubHandler', (StubHandler,), {'state': self.state})
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur /v1/assets local pour les benchmarks")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--assets', type=int, default=1000, help="Nombre de NFTs du wallet servi")
+    parser.add_argument('--address', default='0x' + '1' * 40, help="Adresse du wallet servi")
+    parser.add_argument('--latency', type=float, default=0.0, help="Latence ajoutée par requête (secondes)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Proportion de requêtes en erreur")
+    parser.add_argument('--error-status', type=int, default=500, help="Code HTTP des erreurs simulées")
+    args = parser.parse_args()
+
+    server = StubServer(port=args.port, latency=args.latency, error_rate=args.error_rate,
+                        error_status=args.error_status)
+    server.state.add_wallet(args.address, generate_assets(args.assets, owner=args.address))
+    print(f"Stub ImmutableX sur {server.url} ({args.assets} NFTs pour {args.address})", flush=True)
+    server.httpd.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Générateur de wallets CTA synthétiques au format de l'API /v1/assets"""
+import random
+from datetime import datetime, timezone, timedelta
+
+CTA_COLLECTION = '0xa04bcac09a3ca810796c9e3deee8fdc8c9807166'
+
+RARITIES = ['COMMON', 'UNCOMMON', 'RARE', 'SPECIAL_RARE', 'ULTRA_RARE', 'MYTHIC', 'EXCLUSIVE']
+RARITY_WEIGHTS = [40, 25, 15, 8, 6, 4, 2]
+ELEMENTS = ['FIRE', 'WATER', 'EARTH', 'AIR', 'NEUTRAL']
+ADVANCEMENTS = ['STANDARD', 'ALTERNATIVE', 'COMBO']
+ADVANCEMENT_WEIGHTS = [80, 15, 5]
+FACTIONS = ['HUMAN', 'SPIRIT', 'CORRUPTION', 'NEUTRAL']
+GRADES = [None, 'C', 'B', 'A', 'S']
+GRADE_WEIGHTS = [60, 20, 10, 7, 3]
+
+# Taille du jeu de cartes CTA simulé (nombre de noms distincts)
+CARD_COUNT = 300
+
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def card_catalog(seed=0):
+    """Jeu de cartes fixe : (nom, rareté, élément, faction) par carte"""
+    rng = random.Random(seed)
+    return [
+        (f'Carte {i}', rng.choices(RARITIES, RARITY_WEIGHTS)[0], rng.choice(ELEMENTS), rng.choice(FACTIONS))
+        for i in range(CARD_COUNT)
+    ]
+
+
+def generate_assets(count, owner='0x' + '0' * 40, seed=0):
+    """Retourne count NFTs CTA au format de l'API (dicts comme décodés du JSON)"""
+    rng = random.Random(seed)
+    catalog = card_catalog()
+    assets = []
+    for i in range(count):
+        name, rarity, element, faction = rng.choice(catalog)
+        metadata = {
+            'name': name,
+            'rarity': rarity,
+            'element': element,
+            'advancement': rng.choices(ADVANCEMENTS, ADVANCEMENT_WEIGHTS)[0],
+            'faction': faction,
+            'foil': rng.random() < 0.1,
+            'image': f'https://example.invalid/cards/{i}.png'
+        }
+        grade = rng.choices(GRADES, GRADE_WEIGHTS)[0]
+        if grade:
+            metadata['grade'] = grade
+        updated = BASE_TIME + timedelta(seconds=rng.randrange(365 * 24 * 3600))
+        assets.append({
+            'token_address': CTA_COLLECTION,
+            'token_id': str(1000000 + i),
+            'id': f'0x{i:064x}',
+            'user': owner,
+            'status': 'imx',
+            'uri': None,
+            'name': name,
+            'description': None,
+            'image_url': f'https://example.invalid/cards/{i}.png',
+            'metadata': metadata,
+            'collection': {'name': 'Cross The Ages', 'icon_url': 'https://example.invalid/icon.png'},
+            'created_at': BASE_TIME.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+            'updated_at': updated.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+        })
+    return assets
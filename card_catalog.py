@@ -0,0 +1,139 @@
+import os
+import json
+import logging
+import threading
+
+import metrics
+
+# Catalogue des cartes du processus
+# Chaque carte distincte (nom, rareté, élément, avancement, faction) reçoit un
+# identifiant entier stable, partagé par toutes les tâches : l'agrégation
+# compte par identifiant dans un tableau de 10 compteurs au lieu de clés
+# tuple. Le jeu de cartes CTA est petit et fixe : après les premiers exports,
+# toutes les recherches sont des hits. Le catalogue est rechargé depuis
+# CARD_CATALOG_PATH au démarrage et y est réenregistré quand il a grandi.
+
+logger = logging.getLogger(__name__)
+
+CARD_CATALOG_PATH = os.environ.get('CARD_CATALOG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cards.json'))
+
+# Compteurs d'une carte : Standard, C, B, A, S puis leurs versions foil
+GRADES = ('Standard', 'C', 'B', 'A', 'S')
+COUNTER_NAMES = GRADES + tuple(f'foil_{grade}' for grade in GRADES)
+COUNTER_SIZE = len(COUNTER_NAMES)
+FOIL_OFFSET = len(GRADES)
+
+# Position du compteur de chaque grade (grade vide = Standard)
+GRADE_SLOTS = {'': 0, None: 0, 'C': 1, 'B': 2, 'A': 3, 'S': 4}
+
+
+class CardCatalog:
+    """Table carte <-> identifiant entier, avec statistiques de hits/misses"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._ids = {}
+        self._keys = []
+        self._lock = threading.Lock()
+        self._saved_size = 0
+        self.hits = 0
+        self.misses = 0
+        if path and os.path.exists(path):
+            try:
+                self.load(path)
+            except (OSError, ValueError) as e:
+                # Catalogue illisible : il sera reconstruit au fil des exports
+                logger.warning(f"Catalogue de cartes ignoré ({path}): {e}")
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def ids(self):
+        """Table carte -> identifiant, à consulter directement dans les boucles
+
+        Lecture sans verrou : une carte absente est ajoutée avec add(), puis
+        la recherche est comptée avec record_lookups().
+        """
+        return self._ids
+
+    def add(self, key):
+        """Identifiant d'une carte, créé si elle est nouvelle"""
+        with self._lock:
+            card_id = self._ids.get(key)
+            if card_id is None:
+                # La carte est ajoutée avant d'être publiée dans _ids (lu sans verrou)
+                card_id = len(self._keys)
+                self._keys.append(key)
+                self._ids[key] = card_id
+            return card_id
+
+    def record_lookups(self, hits, misses):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+        if hits:
+            metrics.CACHE_LOOKUPS.inc(hits, 'card_catalog', 'hit')
+        if misses:
+            metrics.CACHE_LOOKUPS.inc(misses, 'card_catalog', 'miss')
+
+    def key(self, card_id):
+        """Carte (nom, rareté, élément, avancement, faction) d'un identifiant"""
+        return self._keys[card_id]
+
+    def load(self, path):
+        """Ajoute les cartes d'un fichier au catalogue"""
+        with open(path, encoding='utf-8') as f:
+            keys = [tuple(key) for key in json.load(f)]
+        with self._lock:
+            for key in keys:
+                if key not in self._ids:
+                    self._keys.append(key)
+                    self._ids[key] = len(self._keys) - 1
+            self._saved_size = len(self._keys)
+
+    def save(self, path=None):
+        """Enregistre le catalogue s'il a grandi depuis le dernier enregistrement"""
+        path = path or self.path
+        if not path or len(self) == self._saved_size:
+            return False
+        # Conserver les cartes enregistrées par les autres workers
+        if os.path.exists(path):
+            self.load(path)
+        with self._lock:
+            keys = list(self._keys)
+        # Écriture atomique : un autre worker peut lire le fichier au même moment
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(keys, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._saved_size = len(keys)
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {'cards': len(self._keys), 'hits': self.hits, 'misses': self.misses}
+
+
+def new_counter():
+    """Tableau de compteurs vide d'une carte"""
+    return [0] * COUNTER_SIZE
+
+
+def counter_dict(counter):
+    """Compteurs d'une carte sous forme de dict {'Standard': .., 'foil_S': ..}"""
+    return dict(zip(COUNTER_NAMES, counter))
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    """Retourne le catalogue partagé du processus (chargé au premier appel)"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = CardCatalog(CARD_CATALOG_PATH)
+        return _catalog
@@ -1,16 +1,21 @@
-from flask import Flask, request, render_template, send_file, jsonify, redirect, url_for
+from flask import Flask, request, render_template, jsonify, redirect, url_for, Response
 import csv
-import json
-import urllib.request
-import urllib.parse
 import io
 import re
 import os
-import time
+import sys
 import threading
 from datetime import datetime
 import socket
 
+# Client ImmutableX partagé (module à la racine du dépôt)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from imx_client import get_client
+from job_store import JobStore
+import metrics
+import result_cache
+import report_formats
+
 app = Flask(__name__, template_folder='templates')
 
 # Regex pour valider les adresses Ethereum
@@ -20,16 +25,27 @@ def is_valid_eth_address(address):
     """Vérifie si l'adresse est une adresse Ethereum valide"""
     return bool(ETH_ADDRESS_REGEX.match(address))
 
-def fetch_assets_for_address(address):
-    """Récupère les NFTs pour une adresse spécifique depuis l'API ImmutableX"""
+def new_checkpoint():
+    """Point de reprise vide : NFTs déjà récupérés (et taille JSON de leurs pages), curseur et numéro de la page suivante"""
+    return {"assets": [], "bytes": 0, "cursor": "", "page": 1}
+
+def fetch_assets_for_address(address, checkpoint=None):
+    """Récupère les NFTs pour une adresse spécifique depuis l'API ImmutableX
+
+    checkpoint (voir new_checkpoint) est mis à jour après chaque page
+    réussie : en cas d'erreur, le rappeler avec le même point de reprise
+    poursuit la récupération au lieu de la recommencer.
+    """
+    if checkpoint is None:
+        checkpoint = new_checkpoint()
     try:
-        base_url = "https://api.x.immutable.com/v1/assets"
-        cursor = ""
-        assets = []
-        page = 1
-        max_pages = 100  # Limite de sécurité pour éviter les boucles infinies
+        cursor = checkpoint["cursor"]
+        assets = checkpoint["assets"]
+        page = checkpoint["page"]
         
-        while page <= max_pages:
+        # Pas de limite de pages : le point de reprise rend une longue
+        # récupération sûre, seule une boucle sur un même curseur est arrêtée
+        while True:
             params = {
                 "user": address,
                 "collection": "0xacb3c6a43d15b907e8433077b6d38ae40936fe2c",  # Collection CTA
@@ -40,31 +56,33 @@ def fetch_assets_for_address(address):
             if cursor:
                 params["cursor"] = cursor
             
-            query_string = urllib.parse.urlencode(params)
-            url = f"{base_url}?{query_string}"
+            response = get_client().get_assets(params)
+            response.raise_for_status()
             
-            req = urllib.request.Request(url, headers={
-                'Accept': 'application/json',
-                'User-Agent': 'Mozilla/5.0'
-            })
+            data = get_client().decode_assets(response)
+            if data.get("cursor") and data.get("cursor") == cursor:
+                # Page non enregistrée : une nouvelle tentative la redemandera
+                return {"error": f"Curseur répété par l'API (page {page}), relancer le traitement pour continuer"}, []
+            current_assets = data.get("result", [])
+            assets.extend(current_assets)
+            checkpoint["bytes"] += len(response.content)
             
-            with urllib.request.urlopen(req) as response:
-                data = json.loads(response.read().decode())
-                current_assets = data.get("result", [])
-                assets.extend(current_assets)
-                
-                # Mettre à jour le compteur de progression si un statut de traitement existe pour cette adresse
-                if address in processing_status:
-                    processing_status[address]["count"] = len(assets)
-                
-                # Vérifier s'il y a une page suivante
-                cursor = data.get("cursor")
-                if not cursor:
-                    break
-                
-                page += 1
-                # Pause courte pour éviter de surcharger l'API
-                time.sleep(0.1)
+            # Mettre à jour le compteur de progression si un statut de traitement existe pour cette adresse
+            if address in processing_status:
+                processing_status[address]["count"] = len(assets)
+                # Les NFTs du point de reprise comptent dans JOB_MAX_BYTES
+                processing_status[address]["retained_bytes"] = checkpoint["bytes"]
+            
+            # Vérifier s'il y a une page suivante
+            cursor = data.get("cursor")
+            # Page enregistrée : une nouvelle tentative repartira de la suivante
+            checkpoint["cursor"] = cursor
+            checkpoint["page"] = page + 1
+            if not cursor:
+                break
+            
+            # Le débit est régulé par le limiteur du client partagé
+            page += 1
         
         return {"success": True}, assets
     except Exception as e:
@@ -197,8 +215,8 @@ def generate_csv(processed_data):
     
     return output.getvalue()
 
-# Stockage temporaire des statuts de traitement
-processing_status = {}
+# Stockage temporaire des statuts de traitement (avec TTL et éviction LRU)
+processing_status = JobStore()
 
 @app.route('/')
 def index():
@@ -211,47 +229,71 @@ def process():
     if not address:
         return jsonify({"error": "Adresse non spécifiée"})
     
+    # Même wallet quelle que soit la casse de l'adresse
+    address = address.strip().lower()
+    
     if not is_valid_eth_address(address):
         return jsonify({"error": "Format d'adresse Ethereum invalide. L'adresse doit être au format 0x suivi de 40 caractères hexadécimaux."})
     
-    # Initialiser le statut de traitement
-    processing_status[address] = {
+    # Une tentative en échec est reprise après sa dernière page réussie
+    previous = processing_status.peek(address)
+    checkpoint = previous.get("checkpoint") if previous and previous["status"] == "error" else None
+    checkpoint = checkpoint or new_checkpoint()
+    
+    # Initialiser le statut de traitement, ou rattacher la requête au
+    # traitement déjà en cours pour ce wallet
+    already_running = processing_status.claim(address, {
         "status": "processing",
-        "count": 0,
+        "count": len(checkpoint["assets"]),
         "error": "",
-        "result": ""
-    }
+        "result": "",
+        "checkpoint": checkpoint,
+        "retained_bytes": checkpoint["bytes"],
+        "resumed_from_page": checkpoint["page"] - 1
+    }) is not None
+    if already_running:
+        metrics.JOBS_DEDUPLICATED.inc(1, 'process')
     
     # Démarrer le traitement en arrière-plan
     def process_data():
         try:
-            # Récupérer les NFTs pour l'adresse
-            processing_status[address]["count"] = 0
-            status, assets = fetch_assets_for_address(address)
+            # Récupérer les NFTs pour l'adresse (à partir du point de reprise)
+            with metrics.STAGE_SECONDS.time('fetch'):
+                status, assets = fetch_assets_for_address(address, checkpoint)
             
             if "error" in status:
                 processing_status[address]["error"] = status["error"]
                 processing_status[address]["status"] = "error"
+                # Tâche terminée : son point de reprise peut être évincé au-delà de JOB_MAX_BYTES
+                processing_status.prune()
                 return
+            # Récupération terminée : le point de reprise n'est plus utile
+            processing_status[address].pop("checkpoint", None)
+            processing_status[address].pop("retained_bytes", None)
             
             # Traiter les NFTs
-            processed_data = process_assets(assets)
+            with metrics.STAGE_SECONDS.time('process_assets'):
+                processed_data = process_assets(assets)
             
             # Générer le fichier CSV
-            csv_data = generate_csv(processed_data)
+            with metrics.STAGE_SECONDS.time('generate_csv'):
+                csv_data = generate_csv(processed_data)
             
             # Stocker le résultat
             processing_status[address]["result"] = csv_data
+            processing_status[address]["result_hash"] = result_cache.content_hash(csv_data)
             processing_status[address]["status"] = "complete"
+            processing_status.prune()
             
         except Exception as e:
             processing_status[address]["error"] = str(e)
             processing_status[address]["status"] = "error"
     
     # Lancer le thread de traitement
-    thread = threading.Thread(target=process_data)
-    thread.daemon = True
-    thread.start()
+    if not already_running:
+        thread = threading.Thread(target=process_data)
+        thread.daemon = True
+        thread.start()
     
     # Rediriger ou répondre avec JSON en fonction du type de requête
     if request.method == 'POST' and request.headers.get('Content-Type') == 'application/x-www-form-urlencoded':
@@ -263,7 +305,7 @@ def process():
 
 @app.route('/api/status', methods=['GET'])
 def api_status():
-    address = request.args.get('address', '')
+    address = request.args.get('address', '').strip().lower()
     
     if not address:
         return jsonify({"error": "Adresse non spécifiée"})
@@ -276,12 +318,13 @@ def api_status():
     return jsonify({
         "status": status["status"],
         "count": status["count"],
-        "error": status["error"]
+        "error": status["error"],
+        "resumed_from_page": status.get("resumed_from_page", 0)
     })
 
 @app.route('/api/download', methods=['GET'])
 def api_download():
-    address = request.args.get('address', '')
+    address = request.args.get('address', '').strip().lower()
     
     if not address:
         return jsonify({"error": "Adresse non spécifiée"})
@@ -294,34 +337,41 @@ def api_download():
     if status["status"] != "complete":
         return jsonify({"error": "Le traitement n'est pas encore terminé"})
     
+    report_format = request.args.get('format', 'csv')
+    if report_format not in report_formats.available_formats():
+        return jsonify({"error": f"Format non disponible: {report_format}"}), 400
+    output_format = report_formats.FORMATS[report_format]
+    
     try:
-        # Créer un fichier en mémoire
-        mem_file = io.BytesIO()
-        mem_file.write(status["result"].encode('utf-8'))
-        mem_file.seek(0)
+        # Résultat adressé par son contenu : ETag fort, 304 si le client l'a
+        # déjà, gzip/brotli selon Accept-Encoding (converti et compressé une
+        # seule fois)
+        payload = status["result"].encode('utf-8')
+        digest = status.get("result_hash") or result_cache.content_hash(payload)
+        result_id = report_formats.variant(digest, report_format)
+        encoding = result_cache.negotiate(request.headers.get('Accept-Encoding')) if output_format.compressible else 'identity'
+        tag = result_cache.etag(result_id, encoding)
+        if result_cache.not_modified(request.headers.get('If-None-Match'), tag):
+            result_cache.DOWNLOADS.inc(1, 304, report_format, encoding)
+            return Response(status=304, headers=result_cache.response_headers(tag, encoding))
         
-        # Générer un nom de fichier avec timestamp pour éviter les problèmes de cache
-        timestamp = int(time.time())
-        filename = f"nft_par_nom_rarete_element_{address[:8]}_{timestamp}.csv"
+        payload = report_formats.convert_cached(payload, digest, report_format)
+        body = result_cache.get_result_cache().encode(payload, result_id, encoding)
+        result_cache.DOWNLOADS.inc(1, 200, report_format, encoding)
         
-        response = send_file(
-            mem_file,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
-        
-        # Ajouter des en-têtes pour éviter la mise en cache
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-        
-        return response
+        filename = result_cache.result_filename(f"nft_par_nom_rarete_element_{address[:8]}", digest, output_format.extension)
+        headers = result_cache.response_headers(tag, encoding, filename)
+        headers["Content-Length"] = str(len(body))
+        return Response(body, content_type=output_format.content_type, headers=headers)
     except Exception as e:
         print(f"Erreur lors du téléchargement: {str(e)}")
         return jsonify({"error": f"Erreur lors du téléchargement: {str(e)}"}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métriques du worker au format texte Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/process', methods=['GET'])
 def api_process():
     address = request.args.get('address', '')
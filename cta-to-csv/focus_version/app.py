@@ -1,16 +1,24 @@
-from flask import Flask, request, render_template, send_file, jsonify, redirect, url_for
+from flask import Flask, request, render_template, jsonify, redirect, url_for, Response
 import csv
 import json
-import urllib.request
-import urllib.parse
 import io
 import re
 import os
+import sys
 import time
 import threading
 from datetime import datetime
 from collections import defaultdict
 
+# Client ImmutableX partagé (module à la racine du dépôt)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from imx_client import get_client
+from records import FocusCardRecord
+from query_plan import ReportQuery
+import metrics
+import result_cache
+import report_formats
+
 app = Flask(__name__, template_folder='templates')
 
 # Regex pour valider les adresses Ethereum
@@ -20,61 +28,74 @@ def is_valid_eth_address(address):
     """Vérifie si l'adresse est une adresse Ethereum valide"""
     return bool(ETH_ADDRESS_REGEX.match(address))
 
-def fetch_assets_for_address(address):
-    """Récupère les NFTs pour une adresse spécifique depuis l'API ImmutableX"""
+def new_checkpoint():
+    """Point de reprise vide : NFTs déjà récupérés (et taille JSON de leurs pages), curseur et numéro de la page suivante"""
+    return {"assets": [], "bytes": 0, "cursor": "", "page": 1, "updated_at": time.time()}
+
+def fetch_assets_for_address(address, checkpoint=None):
+    """Récupère les NFTs pour une adresse spécifique depuis l'API ImmutableX
+
+    checkpoint (voir new_checkpoint) est mis à jour après chaque page
+    réussie : en cas d'erreur, le rappeler avec le même point de reprise
+    poursuit la récupération au lieu de la recommencer.
+    """
+    if checkpoint is None:
+        checkpoint = new_checkpoint()
     try:
-        base_url = "https://api.x.immutable.com/v1/assets"
-        cursor = ""
-        assets = []
-        page = 1
-        max_pages = 100  # Limite de sécurité pour éviter les boucles infinies
+        cursor = checkpoint["cursor"]
+        assets = checkpoint["assets"]
+        page = checkpoint["page"]
         
         print(f"Récupération des NFTs pour l'adresse: {address}", flush=True)
         
-        while page <= max_pages:
+        # Pas de limite de pages : le point de reprise rend une longue
+        # récupération sûre, seule une boucle sur un même curseur est arrêtée
+        while True:
             params = {
                 "user": address,
-                "collection": "0xa04bcac09a3ca810796c9e3deee8fdc8c9807166",  # Collection CTA - adresse correcte
-                "status": "imx",
                 "page_size": 200,  # Taille maximale de page
             }
-            
-            # Collection CTA - ancienne adresse incorrecte
-            # "collection": "0xacb3c6a43d15b907e8433077b6d38ae40936fe2c",
+            # Filtres poussés vers l'API : collection CTA et statut imx
+            params.update(ReportQuery().api_params())
             
             if cursor:
                 params["cursor"] = cursor
             
-            query_string = urllib.parse.urlencode(params)
-            url = f"{base_url}?{query_string}"
+            print(f"Requête API: page {page} {params}", flush=True)
+            
+            response = get_client().get_assets(params)
+            response.raise_for_status()
             
-            print(f"Requête API: {url}", flush=True)
+            data = get_client().decode_assets(response)
+            if data.get("cursor") and data.get("cursor") == cursor:
+                # Page non enregistrée : une nouvelle tentative la redemandera
+                return {"error": f"Curseur répété par l'API (page {page}), relancer le traitement pour continuer"}, []
+            current_assets = data.get("result", [])
+            print(f"NFTs récupérés dans cette page: {len(current_assets)}", flush=True)
+            assets.extend(current_assets)
+            checkpoint["bytes"] += len(response.content)
             
-            req = urllib.request.Request(url, headers={
-                'Accept': 'application/json',
-                'User-Agent': 'Mozilla/5.0'
-            })
+            # Mettre à jour le compteur de progression si un statut de traitement existe pour cette adresse
+            if address in processing_status:
+                processing_status[address]["count"] = len(assets)
             
-            with urllib.request.urlopen(req) as response:
-                data = json.loads(response.read().decode())
-                current_assets = data.get("result", [])
-                print(f"NFTs récupérés dans cette page: {len(current_assets)}", flush=True)
-                assets.extend(current_assets)
-                
-                # Mettre à jour le compteur de progression si un statut de traitement existe pour cette adresse
-                if address in processing_status:
-                    processing_status[address]["count"] = len(assets)
-                
-                # Vérifier s'il y a une page suivante
-                cursor = data.get("cursor")
-                if not cursor:
-                    break
-                
-                page += 1
-                # Pause courte pour éviter de surcharger l'API
-                time.sleep(0.1)
+            # Vérifier s'il y a une page suivante
+            cursor = data.get("cursor")
+            # Page enregistrée : une nouvelle tentative repartira de la suivante
+            checkpoint["cursor"] = cursor
+            checkpoint["page"] = page + 1
+            checkpoint["updated_at"] = time.time()
+            if not cursor:
+                break
+            
+            # Le débit est régulé par le limiteur du client partagé
+            page += 1
         
         print(f"Total des NFTs récupérés: {len(assets)}", flush=True)
+        stats = get_client().stats()
+        print(f"Transfert: {stats['bytes_wire']} octets, {stats['avg_page_bytes']} octets/page, "
+              f"{stats['handshakes']} connexion(s) ouverte(s) pour {stats['pages']} page(s), "
+              f"{stats['wait_time']:.2f}s d'attente / {stats['fetch_time']:.2f}s de requêtes", flush=True)
         return {"success": True}, assets
     except Exception as e:
         print(f"Erreur lors de la récupération des NFTs: {str(e)}", flush=True)
@@ -109,21 +130,15 @@ def process_assets(assets):
             grade = metadata.get('grade', '')
             is_foil = metadata.get('foil', False)
             
-            # Ajouter à la liste des données traitées
-            processed_data.append({
-                'collection': collection_name,
-                'collection_address': collection_address,
-                'is_cta': is_cta,
-                'token_id': token_id,
-                'token_address': token_address,
-                'name': name,
-                'rarity': rarity,
-                'element': element,
-                'advancement': advancement,
-                'faction': faction,
-                'grade': grade,
-                'is_foil': is_foil
-            })
+            # Ajouter à la liste des données traitées (enregistrement compact)
+            processed_data.append(FocusCardRecord(
+                name, rarity, element, advancement, faction, grade, is_foil,
+                token_id=token_id,
+                token_address=token_address,
+                collection=collection_name,
+                collection_address=collection_address,
+                is_cta=is_cta
+            ))
             
         except Exception as e:
             print(f"Erreur lors du traitement d'un NFT: {e}")
@@ -137,13 +152,13 @@ def generate_csv(processed_data):
     print(f"Nombre total de NFTs à traiter: {len(processed_data)}", flush=True)
     
     # Vérifier combien de NFTs sont des CTA
-    cta_count = sum(1 for item in processed_data if item.get('is_cta', False))
+    cta_count = sum(1 for item in processed_data if item.is_cta)
     print(f"Nombre de NFTs CTA: {cta_count}", flush=True)
     
     # Afficher quelques exemples de NFTs pour le débogage
     if processed_data:
         print("Exemple de NFT:", flush=True)
-        print(json.dumps(processed_data[0], indent=2), flush=True)
+        print(json.dumps(processed_data[0].to_dict(), indent=2), flush=True)
     
     # Définir l'ordre des raretés pour le tri
     RARITY_ORDER = {
@@ -174,18 +189,13 @@ def generate_csv(processed_data):
     # Compter les cartes par nom, rareté, élément, avancement et faction
     for item in processed_data:
         # Ignorer les NFTs qui ne sont pas des CTA
-        if not item.get('is_cta', False):
+        if not item.is_cta:
             continue
             
-        name = item['name']
-        rarity = item['rarity']
-        element = item['element']
-        advancement = item['advancement']
-        faction = item['faction']
-        grade = item['grade']
-        is_foil = item['is_foil']
+        grade = item.grade
+        is_foil = item.is_foil
         
-        key = (name, rarity, element, advancement, faction)
+        key = item.key()
         
         if not grade:  # Si grade est vide, c'est Standard
             counts[key]['Standard'] += 1
@@ -241,6 +251,28 @@ def generate_csv(processed_data):
 
 # Stockage temporaire des statuts de traitement
 processing_status = {}
+processing_lock = threading.Lock()
+
+# Points de reprise des tâches en échec : abandonnés après CHECKPOINT_TTL
+# secondes, et les plus anciens au-delà de CHECKPOINT_MAX_BYTES (taille JSON
+# des pages conservées) ; la tâche est alors reprise depuis la première page
+CHECKPOINT_TTL = int(os.environ.get('CHECKPOINT_TTL', '900'))
+CHECKPOINT_MAX_BYTES = int(os.environ.get('CHECKPOINT_MAX_BYTES', str(50 * 1024 * 1024)))
+
+def prune_checkpoints():
+    """Abandonne les points de reprise expirés ou en excès (appelé sous processing_lock)"""
+    now = time.time()
+    failed = sorted(
+        ((job["checkpoint"]["updated_at"], address) for address, job in processing_status.items()
+         if job["status"] == "error" and "checkpoint" in job),
+        reverse=True
+    )
+    total = 0
+    # Du plus récent au plus ancien
+    for updated_at, address in failed:
+        total += processing_status[address]["checkpoint"]["bytes"]
+        if now - updated_at > CHECKPOINT_TTL or total > CHECKPOINT_MAX_BYTES:
+            del processing_status[address]["checkpoint"]
 
 @app.route('/')
 def index():
@@ -253,28 +285,50 @@ def process():
     if not address:
         return jsonify({"error": "Adresse non spécifiée"})
     
+    # Même wallet quelle que soit la casse de l'adresse
+    address = address.strip().lower()
+    
     if not is_valid_eth_address(address):
         return jsonify({"error": "Format d'adresse Ethereum invalide. L'adresse doit être au format 0x suivi de 40 caractères hexadécimaux."})
     
-    # Initialiser le statut de traitement
-    processing_status[address] = {
-        "status": "processing",
-        "count": 0,
-        "error": "",
-        "result": ""
-    }
+    # Un seul traitement à la fois par wallet : les requêtes suivantes se
+    # rattachent à celui en cours et en partagent le résultat
+    with processing_lock:
+        prune_checkpoints()
+        current = processing_status.get(address)
+        if current and current["status"] == "processing":
+            metrics.JOBS_DEDUPLICATED.inc(1, 'process')
+            return jsonify({"status": "processing", "address": address})
+        
+        # Une tentative en échec est reprise après sa dernière page réussie
+        checkpoint = current.get("checkpoint") if current and current["status"] == "error" else None
+        checkpoint = checkpoint or new_checkpoint()
+        
+        # Initialiser le statut de traitement
+        processing_status[address] = {
+            "status": "processing",
+            "count": len(checkpoint["assets"]),
+            "error": "",
+            "result": "",
+            "checkpoint": checkpoint,
+            "resumed_from_page": checkpoint["page"] - 1
+        }
     
     # Démarrer le traitement en arrière-plan
     def process_data():
         try:
-            # Récupérer les NFTs pour l'adresse
-            processing_status[address]["count"] = 0
-            status, assets = fetch_assets_for_address(address)
+            # Récupérer les NFTs pour l'adresse (à partir du point de reprise)
+            with metrics.STAGE_SECONDS.time('fetch'):
+                status, assets = fetch_assets_for_address(address, checkpoint)
             
             if "error" in status:
-                processing_status[address]["error"] = status["error"]
-                processing_status[address]["status"] = "error"
+                with processing_lock:
+                    processing_status[address]["error"] = status["error"]
+                    processing_status[address]["status"] = "error"
+                    prune_checkpoints()
                 return
+            # Récupération terminée : le point de reprise n'est plus utile
+            processing_status[address].pop("checkpoint", None)
             
             # Vérifier si des NFTs ont été trouvés
             if not assets:
@@ -283,13 +337,16 @@ def process():
                 return
             
             # Traiter les NFTs
-            processed_data = process_assets(assets)
+            with metrics.STAGE_SECONDS.time('process_assets'):
+                processed_data = process_assets(assets)
             
             # Générer le fichier CSV
-            csv_data = generate_csv(processed_data)
+            with metrics.STAGE_SECONDS.time('generate_csv'):
+                csv_data = generate_csv(processed_data)
             
             # Stocker le résultat
             processing_status[address]["result"] = csv_data
+            processing_status[address]["result_hash"] = result_cache.content_hash(csv_data)
             processing_status[address]["status"] = "complete"
             
         except Exception as e:
@@ -305,7 +362,7 @@ def process():
 
 @app.route('/status', methods=['GET'])
 def api_status():
-    address = request.args.get('address', '')
+    address = request.args.get('address', '').strip().lower()
     
     if not address:
         return jsonify({"error": "Adresse non spécifiée"})
@@ -318,12 +375,13 @@ def api_status():
     return jsonify({
         "status": status["status"],
         "count": status["count"],
-        "error": status["error"]
+        "error": status["error"],
+        "resumed_from_page": status.get("resumed_from_page", 0)
     })
 
 @app.route('/download', methods=['GET'])
 def api_download():
-    address = request.args.get('address', '')
+    address = request.args.get('address', '').strip().lower()
     
     if not address:
         return jsonify({"error": "Adresse non spécifiée"})
@@ -336,34 +394,41 @@ def api_download():
     if status["status"] != "complete":
         return jsonify({"error": "Le traitement n'est pas encore terminé"})
     
+    report_format = request.args.get('format', 'csv')
+    if report_format not in report_formats.available_formats():
+        return jsonify({"error": f"Format non disponible: {report_format}"}), 400
+    output_format = report_formats.FORMATS[report_format]
+    
     try:
-        # Créer un fichier en mémoire
-        mem_file = io.BytesIO()
-        mem_file.write(status["result"].encode('utf-8'))
-        mem_file.seek(0)
-        
-        # Générer un nom de fichier avec timestamp pour éviter les problèmes de cache
-        timestamp = int(time.time())
-        filename = f"nft_par_nom_rarete_element_{address[:8]}_{timestamp}.csv"
+        # Résultat adressé par son contenu : ETag fort, 304 si le client l'a
+        # déjà, gzip/brotli selon Accept-Encoding (converti et compressé une
+        # seule fois)
+        payload = status["result"].encode('utf-8')
+        digest = status.get("result_hash") or result_cache.content_hash(payload)
+        result_id = report_formats.variant(digest, report_format)
+        encoding = result_cache.negotiate(request.headers.get('Accept-Encoding')) if output_format.compressible else 'identity'
+        tag = result_cache.etag(result_id, encoding)
+        if result_cache.not_modified(request.headers.get('If-None-Match'), tag):
+            result_cache.DOWNLOADS.inc(1, 304, report_format, encoding)
+            return Response(status=304, headers=result_cache.response_headers(tag, encoding))
         
-        response = send_file(
-            mem_file,
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name=filename
-        )
+        payload = report_formats.convert_cached(payload, digest, report_format)
+        body = result_cache.get_result_cache().encode(payload, result_id, encoding)
+        result_cache.DOWNLOADS.inc(1, 200, report_format, encoding)
         
-        # Ajouter des en-têtes pour éviter la mise en cache
-        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-        response.headers["Pragma"] = "no-cache"
-        response.headers["Expires"] = "0"
-        response.headers["Content-Disposition"] = f"attachment; filename={filename}"
-        
-        return response
+        filename = result_cache.result_filename(f"nft_par_nom_rarete_element_{address[:8]}", digest, output_format.extension)
+        headers = result_cache.response_headers(tag, encoding, filename)
+        headers["Content-Length"] = str(len(body))
+        return Response(body, content_type=output_format.content_type, headers=headers)
     except Exception as e:
         print(f"Erreur lors du téléchargement: {str(e)}")
         return jsonify({"error": f"Erreur lors du téléchargement: {str(e)}"}), 500
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Métriques du worker au format texte Prometheus"""
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/test', methods=['GET'])
 def api_test():
     return jsonify({"status": "ok", "message": "L'API fonctionne correctement"})
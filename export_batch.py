@@ -0,0 +1,232 @@
+"""Export en lot : un rapport par wallet, sans passer par le serveur HTTP
+
+Les wallets sont synchronisés en parallèle (threads) avec sync_wallet, donc
+avec le client ImmutableX et le limiteur de débit du processus : toutes les
+récupérations consomment le même budget de requêtes (IMX_RATE_LIMIT...).
+Les NFTs traités par process_assets sont enregistrés dans l'instantané local
+(ASSET_DB_PATH) ; l'agrégation et l'écriture du rapport (generate_csv, puis
+conversion éventuelle, voir report_formats) sont faites dans un pool de
+processus qui relit cet instantané.
+
+Chaque wallet terminé est ajouté au manifeste (manifest.jsonl du dossier de
+sortie), avec le format et l'empreinte des filtres du rapport. Relancer la
+même commande reprend là où l'exécution s'est arrêtée : les wallets déjà
+exportés (ou vides) dans ce format et avec ces filtres sont ignorés, ceux en
+erreur sont retentés. Un autre format ou d'autres filtres dans le même
+dossier exportent à nouveau tous les wallets (fichiers distincts).
+
+Usage : python export_batch.py wallets.txt --output exports/ [--format jsonl]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+import app
+import report_formats
+import result_cache
+from asset_store import get_asset_store
+from query_plan import ReportQuery
+
+MANIFEST_NAME = 'manifest.jsonl'
+
+# États définitifs : le wallet n'est pas repris
+FINAL_STATUSES = ('done', 'empty')
+
+
+def read_addresses(path):
+    """Adresses d'un fichier (une ou plusieurs par ligne, '#' pour les commentaires ; '-' pour stdin)
+
+    Retourne (adresses valides normalisées et dédupliquées, entrées invalides).
+    """
+    stream = sys.stdin if path == '-' else open(path, encoding='utf-8')
+    with stream:
+        text = '\n'.join(line.split('#', 1)[0] for line in stream)
+    addresses = {}
+    invalid = []
+    for raw in re.split(r'[\s,;]+', text):
+        if not raw:
+            continue
+        address = app.normalize_address(raw)
+        if app.is_valid_eth_address(address):
+            addresses.setdefault(address, None)
+        else:
+            invalid.append(raw)
+    return list(addresses), invalid
+
+
+def manifest_key(address, report_format, signature):
+    """Clé d'un export dans le manifeste : un wallet dans un format avec des filtres"""
+    return address, report_format, signature
+
+
+def read_manifest(path):
+    """Dernière entrée du manifeste pour chaque export (voir manifest_key)
+
+    Les entrées sans format ni filtres (manifeste d'une version précédente)
+    ne correspondent à aucun export : ces wallets sont exportés à nouveau.
+    """
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Dernière ligne tronquée par une interruption
+                continue
+            entries[manifest_key(entry['address'], entry.get('format'), entry.get('options'))] = entry
+    return entries
+
+
+class Manifest:
+    """Journal des wallets traités, en ajout seul (une ligne JSON par wallet)"""
+
+    def __init__(self, path, report_format, signature):
+        self.path = path
+        self.report_format = report_format
+        self.signature = signature
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def record(self, address, status, **fields):
+        entry = {'address': address, 'format': self.report_format, 'options': self.signature, 'status': status,
+                 'at': datetime.now(timezone.utc).isoformat()}
+        entry.update(fields)
+        self._file.write(json.dumps(entry) + '\n')
+        # Visible sur disque avant de passer au wallet suivant
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return entry
+
+    def close(self):
+        self._file.close()
+
+
+def build_report(address, options, output_dir, report_format):
+    """Agrège l'instantané d'un wallet et écrit son rapport (exécuté dans le pool de processus)"""
+    query = ReportQuery.from_form(options)
+    records = list(get_asset_store().iter_processed(app.snapshot_scope(address, query)))
+    payload = app.generate_csv(records).encode('utf-8')
+    body = report_formats.convert(payload, report_format)
+
+    # Un fichier par jeu de filtres : des exports filtrés différemment ne s'écrasent pas
+    name = address if query.is_default() else f'{address}_{query.signature()}'
+    path = os.path.join(output_dir, f'{name}.{report_formats.FORMATS[report_format].extension}')
+    # Écriture atomique : un fichier présent est toujours complet
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(body)
+    os.replace(tmp_path, path)
+    app.save_card_catalog()
+    return {
+        'file': os.path.basename(path),
+        'rows': payload.count(b'\n') - 1,
+        'sha256': result_cache.content_hash(payload)
+    }
+
+
+def run(addresses, output_dir, options, report_format='csv', fetch_workers=8, process_workers=None, log=print):
+    """Exporte les wallets qui ne sont pas encore dans le manifeste ; retourne le nombre par état"""
+    query = ReportQuery.from_form(options)
+    os.makedirs(output_dir, exist_ok=True)
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    previous = read_manifest(manifest_path)
+    signature = query.signature()
+    pending = [a for a in addresses
+               if previous.get(manifest_key(a, report_format, signature), {}).get('status') not in FINAL_STATUSES]
+    totals = {'done': 0, 'empty': 0, 'error': 0, 'skipped': len(addresses) - len(pending)}
+    if totals['skipped']:
+        log(f"{totals['skipped']} wallet(s) déjà exporté(s) d'après {manifest_path}")
+
+    started = time.monotonic()
+    fetched = {}
+    manifest = Manifest(manifest_path, report_format, signature)
+    # spawn : les workers n'héritent pas des threads (limiteur, pool de récupération) du processus principal
+    builders = ProcessPoolExecutor(max_workers=process_workers, mp_context=multiprocessing.get_context('spawn'))
+    fetchers = ThreadPoolExecutor(max_workers=fetch_workers)
+    futures = {fetchers.submit(app.sync_wallet, address, None, query): ('fetch', address) for address in pending}
+    try:
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, address = futures.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    manifest.record(address, 'error', stage=stage, error=str(e))
+                    totals['error'] += 1
+                    log(f"{address}: erreur ({stage}) {e}")
+                    continue
+
+                if stage == 'fetch':
+                    count, stats = result
+                    fetched[address] = {'nfts': count, 'pages': stats['pages'], 'bytes': stats['bytes']}
+                    if not count:
+                        manifest.record(address, 'empty', **fetched.pop(address))
+                        totals['empty'] += 1
+                        continue
+                    future = builders.submit(build_report, address, options, output_dir, report_format)
+                    futures[future] = ('build', address)
+                else:
+                    manifest.record(address, 'done', **fetched.pop(address), **result)
+                    totals['done'] += 1
+                    completed = totals['done'] + totals['empty'] + totals['error']
+                    log(f"[{completed}/{len(pending)}] {address}: {result['rows']} ligne(s) -> {result['file']}")
+    except KeyboardInterrupt:
+        log("Interrompu : relancer la même commande pour reprendre")
+        for future in futures:
+            future.cancel()
+        raise
+    finally:
+        fetchers.shutdown(wait=True, cancel_futures=True)
+        builders.shutdown(wait=True, cancel_futures=True)
+        manifest.close()
+
+    log(f"{totals['done']} exporté(s), {totals['empty']} vide(s), {totals['error']} en erreur, "
+        f"{totals['skipped']} ignoré(s) en {time.monotonic() - started:.1f} s")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export en lot des inventaires de plusieurs wallets")
+    parser.add_argument('addresses', help="Fichier d'adresses (une ou plusieurs par ligne, '-' pour stdin)")
+    parser.add_argument('--output', default='exports', help="Dossier des rapports et du manifeste")
+    parser.add_argument('--format', default='csv', help="csv, jsonl, parquet ou arrow (selon pyarrow)")
+    parser.add_argument('--fetch-workers', type=int, default=8, help="Wallets récupérés en parallèle")
+    parser.add_argument('--process-workers', type=int, default=None, help="Processus d'agrégation (défaut: nombre de CPU)")
+    parser.add_argument('--collection', default='', help="Adresse de la collection (défaut: CTA)")
+    parser.add_argument('--rarities', default='', help="Raretés à inclure, séparées par des virgules")
+    parser.add_argument('--grades', default='', help="Grades à inclure, séparés par des virgules")
+    parser.add_argument('--foil-only', action='store_true', help="Uniquement les cartes foil")
+    args = parser.parse_args()
+
+    if args.format not in report_formats.available_formats():
+        parser.error(f"format non disponible: {args.format} (disponibles: {', '.join(report_formats.available_formats())})")
+    options = {'collection': args.collection, 'rarities': args.rarities, 'grades': args.grades,
+               'foil_only': 'true' if args.foil_only else ''}
+    try:
+        ReportQuery.from_form(options)
+    except ValueError as e:
+        parser.error(str(e))
+
+    addresses, invalid = read_addresses(args.addresses)
+    for raw in invalid:
+        print(f"Adresse ignorée (invalide): {raw}", file=sys.stderr)
+    if not addresses:
+        parser.error("aucune adresse valide")
+
+    try:
+        totals = run(addresses, args.output, options, args.format, args.fetch_workers, args.process_workers)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    sys.exit(1 if totals['error'] else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+import csv
+import io
+
+try:
+    import numpy as np
+except ImportError:  # NumPy est optionnel
+    np = None
+
+from card_catalog import get_catalog, COUNTER_SIZE, FOIL_OFFSET, GRADE_SLOTS
+
+# Moteur d'agrégation vectorisé (NumPy, optionnel)
+# Les cartes sont encodées par leur identifiant du catalogue (card_catalog),
+# les COUNTER_SIZE compteurs grade x foil sont calculés par bincount groupé et le tri
+# utilise les rangs RARITY_ORDER/ADVANCEMENT_ORDER précalculés.
+# Le résultat est identique octet pour octet à celui de la boucle Python :
+# les cartes gardent l'ordre de leur première apparition avant le tri stable.
+
+
+def available():
+    """Indique si NumPy est installé"""
+    return np is not None
+
+
+def _encode(processed_data):
+    """Encode les NFTs en colonnes d'entiers
+
+    Retourne (card_codes, slots, foils) ; card_codes contient les
+    identifiants du catalogue de cartes.
+    """
+    catalog = get_catalog()
+    get_id = catalog.ids.get
+    get_slot = GRADE_SLOTS.get
+    misses = 0
+    card_codes = []
+    slots = []
+    foils = []
+    for item in processed_data:
+        slot = get_slot(item.grade)
+        if slot is None:
+            # Grade inconnu : ignoré, comme dans la boucle Python
+            continue
+        card_id = get_id(item.key())
+        if card_id is None:
+            card_id = catalog.add(item.key())
+            misses += 1
+        card_codes.append(card_id)
+        slots.append(slot)
+        foils.append(item.is_foil)
+    catalog.record_lookups(len(card_codes) - misses, misses)
+    return np.asarray(card_codes, dtype=np.int64), np.asarray(slots, dtype=np.int64), np.asarray(foils, dtype=bool)
+
+
+def _count_matrix(n_cards, card_codes, slots, foils):
+    """Matrice (cartes x COUNTER_SIZE) des compteurs Standard..S puis foil_Standard..foil_S"""
+    flat = card_codes * COUNTER_SIZE + slots
+    matrix = np.bincount(flat, minlength=n_cards * COUNTER_SIZE)
+    foil_flat = flat[foils] + FOIL_OFFSET
+    matrix += np.bincount(foil_flat, minlength=n_cards * COUNTER_SIZE)
+    return matrix.reshape(n_cards, COUNTER_SIZE)
+
+
+def aggregate_numpy(processed_data):
+    """Agrège les NFTs traités
+
+    Retourne (identifiants de cartes dans l'ordre de première apparition,
+    matrice de compteurs alignée sur ces identifiants).
+    """
+    card_codes, slots, foils = _encode(processed_data)
+    if not len(card_codes):
+        return [], np.zeros((0, COUNTER_SIZE), dtype=np.int64)
+    n_cards = int(card_codes.max()) + 1
+    # Position de la première apparition de chaque carte (len(card_codes) si absente)
+    first_seen = np.full(n_cards, len(card_codes), dtype=np.int64)
+    np.minimum.at(first_seen, card_codes, np.arange(len(card_codes), dtype=np.int64))
+    present = np.flatnonzero(first_seen < len(card_codes))
+    card_ids = present[np.argsort(first_seen[present], kind='stable')]
+    matrix = _count_matrix(n_cards, card_codes, slots, foils)
+    return card_ids.tolist(), matrix[card_ids]
+
+
+def counts_from_matrix(card_ids, matrix, counts):
+    """Ajoute les compteurs de la matrice dans les compteurs par carte (voir new_counts)"""
+    for card_id, row in zip(card_ids, matrix.tolist()):
+        counter = counts[card_id]
+        for index, value in enumerate(row):
+            counter[index] += value
+    return counts
+
+
+def write_csv_numpy(keys, matrix, fieldnames, rarity_order, advancement_order):
+    """Trie les cartes avec les rangs précalculés et génère le CSV"""
+    rarity_rank = np.asarray([rarity_order.get(key[1], 999) for key in keys], dtype=np.int64)
+    advancement_rank = np.asarray([advancement_order.get(key[3], 999) for key in keys], dtype=np.int64)
+    # lexsort est stable : à rang égal, l'ordre de première apparition est conservé
+    order = np.lexsort((advancement_rank, rarity_rank)) if keys else []
+
+    output = io.StringIO()
+    writer = csv.writer(output, delimiter=';')
+    writer.writerow(fieldnames)
+    rows = matrix.tolist()
+    writer.writerows(list(keys[i]) + rows[i] for i in order)
+    return output.getvalue()
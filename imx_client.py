@@ -0,0 +1,147 @@
+import os
+import threading
+import time
+import logging
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limiter import AdaptiveRateLimiter
+import metrics
+import asset_decode
+
+# Client HTTP partagé pour l'API ImmutableX
+# Une seule session keep-alive est réutilisée par toutes les tâches (et par les
+# trois versions de l'application) : la poignée de main TCP+TLS n'est payée
+# qu'une fois par connexion du pool au lieu d'une fois par page.
+
+IMX_API_URL = os.environ.get('IMX_API_URL', "https://api.x.immutable.com")
+
+DEFAULT_HEADERS = {
+    'Accept': 'application/json',
+    'Accept-Encoding': 'gzip',
+    'User-Agent': 'Mozilla/5.0'
+}
+
+# Débit initial et maximal (requêtes/seconde) du limiteur adaptatif
+IMX_RATE_LIMIT = float(os.environ.get('IMX_RATE_LIMIT', '5'))
+IMX_RATE_MAX = float(os.environ.get('IMX_RATE_MAX', '20'))
+IMX_RATE_BURST = int(os.environ.get('IMX_RATE_BURST', '5'))
+
+# Connexions keep-alive du pool. Les threads de récupération (workers,
+# partitions, portefeuilles) sont plus nombreux : au-delà, une requête
+# attend qu'une connexion se libère au lieu d'en ouvrir une jetable (le
+# limiteur de débit borne de toute façon le nombre de requêtes en vol utiles).
+IMX_POOL_SIZE = int(os.environ.get('IMX_POOL_SIZE', '10'))
+
+logger = logging.getLogger(__name__)
+
+
+class ImxClient:
+    """Session HTTP poolée vers l'API ImmutableX avec statistiques de transfert"""
+
+    def __init__(self, base_url=IMX_API_URL, pool_size=IMX_POOL_SIZE, connect_timeout=5, read_timeout=30,
+                 limiter=None, max_retries=3):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._adapter = adapter
+        if limiter is None:
+            limiter = AdaptiveRateLimiter(rate=IMX_RATE_LIMIT, burst=IMX_RATE_BURST, max_rate=IMX_RATE_MAX)
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._stats = {
+            'pages': 0,
+            'bytes_wire': 0,
+            'bytes_decoded': 0,
+            'last_page_bytes': 0,
+            'fetch_time': 0.0
+        }
+
+    def get(self, path, params=None):
+        """Effectue un GET sur l'API et comptabilise les octets reçus
+
+        Chaque requête passe par le limiteur de débit ; les réponses 429 sont
+        rejouées (au plus max_retries fois) après l'attente imposée par l'API.
+        """
+        for attempt in range(self.max_retries + 1):
+            waited = self.limiter.acquire()
+            if waited:
+                metrics.IMX_RATE_WAIT_SECONDS.inc(waited)
+            started = time.monotonic()
+            response = self.session.get(f"{self.base_url}{path}", params=params, timeout=self.timeout)
+            # Lire le corps maintenant pour connaître la taille compressée transférée
+            content = response.content
+            elapsed = time.monotonic() - started
+            self.limiter.update(response.status_code, response.headers)
+            metrics.IMX_REQUESTS.inc(1, response.status_code)
+            metrics.IMX_REQUEST_SECONDS.observe(elapsed)
+            with self._lock:
+                self._stats['fetch_time'] += elapsed
+            if response.status_code != 429:
+                break
+            logger.warning("429 reçu de l'API (tentative %d)", attempt + 1)
+        wire = response.raw.tell() if hasattr(response.raw, 'tell') else len(content)
+        response.wire_bytes = wire
+        with self._lock:
+            self._stats['pages'] += 1
+            self._stats['bytes_wire'] += wire
+            self._stats['bytes_decoded'] += len(content)
+            self._stats['last_page_bytes'] = wire
+        metrics.IMX_BYTES.inc(wire, 'wire')
+        metrics.IMX_BYTES.inc(len(content), 'decoded')
+        logger.debug("Page %s: %d octets reçus (%d décompressés)", path, wire, len(content))
+        return response
+
+    def decode(self, response):
+        """Décode le corps JSON d'une réponse en mesurant la durée du décodage"""
+        with metrics.IMX_DECODE_SECONDS.time('json'):
+            return response.json()
+
+    def decode_assets(self, response):
+        """Décode une page /v1/assets en ne gardant que les champs utiles (voir asset_decode)"""
+        decoder = asset_decode.default_decoder()
+        with metrics.IMX_DECODE_SECONDS.time(decoder):
+            return asset_decode.decode_page(response.content, decoder)
+
+    def get_assets(self, params):
+        """Récupère une page de /v1/assets"""
+        return self.get('/v1/assets', params)
+
+    def handshakes(self):
+        """Nombre de connexions (poignées de main TCP+TLS) ouvertes par le pool"""
+        pools = self._adapter.poolmanager.pools
+        return sum(pools[key].num_connections for key in pools.keys())
+
+    def stats(self):
+        """Retourne une copie des statistiques de transfert"""
+        with self._lock:
+            stats = dict(self._stats)
+        stats['handshakes'] = self.handshakes()
+        limiter_stats = self.limiter.stats()
+        stats['wait_time'] = limiter_stats['wait_time']
+        stats['throttled'] = limiter_stats['throttled']
+        stats['rate'] = limiter_stats['rate']
+        if stats['pages']:
+            stats['avg_page_bytes'] = stats['bytes_wire'] // stats['pages']
+        else:
+            stats['avg_page_bytes'] = 0
+        return stats
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Retourne le client partagé du processus (créé au premier appel)"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ImxClient()
+        return _client
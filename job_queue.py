@@ -0,0 +1,90 @@
+import threading
+import queue
+import time
+import logging
+
+import metrics
+
+# Ordonnanceur de tâches : un nombre fixe de workers consomme une file FIFO
+# bornée, au lieu d'un thread par appel à /process.
+
+logger = logging.getLogger(__name__)
+
+QUEUE_WAIT_SECONDS = metrics.REGISTRY.histogram('job_queue_wait_seconds', "Attente d'une tâche dans la file avant son démarrage")
+JOB_SECONDS = metrics.REGISTRY.histogram('job_duration_seconds', "Durée d'exécution des tâches", ('result',))
+
+
+class QueueFullError(Exception):
+    """La file d'attente des tâches est pleine"""
+
+
+class JobScheduler:
+    """Pool de workers de taille fixe alimenté par une file FIFO bornée"""
+
+    def __init__(self, workers=4, max_queue=100):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pending = []  # Clés en attente, dans l'ordre de la file
+        self._running = set()
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_started(self):
+        # Démarrage paresseux : aucun thread n'est créé à l'import du module
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}")
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, key, func, *args):
+        """Ajoute une tâche à la file ; lève QueueFullError si la file est pleine"""
+        with self._lock:
+            self._ensure_started()
+            try:
+                self._queue.put_nowait((key, func, args, time.monotonic()))
+            except queue.Full:
+                raise QueueFullError(f"File d'attente pleine ({self.max_queue} tâches)")
+            self._pending.append(key)
+            return len(self._pending)
+
+    def _worker(self):
+        while True:
+            key, func, args, submitted = self._queue.get()
+            with self._lock:
+                self._pending.remove(key)
+                self._running.add(key)
+            started = time.monotonic()
+            QUEUE_WAIT_SECONDS.observe(started - submitted)
+            result = 'ok'
+            try:
+                func(*args)
+            except Exception as e:
+                result = 'exception'
+                logger.error(f"Erreur dans la tâche {key}: {str(e)}")
+            finally:
+                JOB_SECONDS.observe(time.monotonic() - started, result)
+                with self._lock:
+                    self._running.discard(key)
+                self._queue.task_done()
+
+    def position(self, key):
+        """Position (1 = prochaine) d'une tâche en attente, 0 si elle tourne ou n'est pas en file"""
+        with self._lock:
+            try:
+                return self._pending.index(key) + 1
+            except ValueError:
+                return 0
+
+    def stats(self):
+        """Retourne la profondeur de file et l'occupation des workers"""
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_queue': self.max_queue,
+                'queued': len(self._pending),
+                'running': len(self._running)
+            }
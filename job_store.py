@@ -0,0 +1,434 @@
+import os
+import json
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+# Registre des tâches avec durée de vie (TTL) et éviction LRU
+# S'utilise comme un dict (request_status[address]['status'] ...) mais les
+# résultats terminés expirent après JOB_TTL secondes sans accès, et les
+# entrées les moins récemment utilisées sont évincées quand le nombre d'entrées
+# ou la taille totale des résultats dépasse la limite. Les tâches en cours ne
+# sont jamais évincées.
+
+JOB_TTL = int(os.environ.get('JOB_TTL', '3600'))
+JOB_MAX_ENTRIES = int(os.environ.get('JOB_MAX_ENTRIES', '1000'))
+JOB_MAX_BYTES = int(os.environ.get('JOB_MAX_BYTES', str(200 * 1024 * 1024)))
+
+# Backend du registre : 'memory' (propre à chaque worker) ou 'sqlite'
+# (fichier partagé par tous les workers gunicorn d'une même machine)
+JOB_STORE_BACKEND = os.environ.get('JOB_STORE_BACKEND', 'memory')
+JOB_STORE_PATH = os.environ.get('JOB_STORE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs.db'))
+
+# Backend SQLite : chaque processus signale qu'il est en vie toutes les
+# JOB_HEARTBEAT_INTERVAL secondes. Une tâche active dont le processus ne
+# s'est pas signalé depuis JOB_OWNER_TIMEOUT secondes (redémarrage, worker
+# tué) est considérée interrompue : elle apparaît en erreur, expire comme
+# une tâche terminée et une nouvelle requête la remplace.
+JOB_HEARTBEAT_INTERVAL = float(os.environ.get('JOB_HEARTBEAT_INTERVAL', '10'))
+JOB_OWNER_TIMEOUT = float(os.environ.get('JOB_OWNER_TIMEOUT', '60'))
+
+ACTIVE_STATUSES = ('queued', 'processing', 'processing_complete')
+
+# Champs volumineux exclus de peek() (et stockés à part dans le backend SQLite)
+PAYLOAD_FIELD = 'csv_content'
+
+# Taille déclarée des données conservées autrement qu'en chaînes (ex. NFTs
+# d'un point de reprise), comptée dans JOB_MAX_BYTES
+RETAINED_BYTES_FIELD = 'retained_bytes'
+
+INTERRUPTED_ERROR = "Tâche interrompue (redémarrage du serveur), veuillez relancer l'export"
+
+
+def _entry_size(entry):
+    """Taille approximative d'une entrée (octets des chaînes stockées et taille déclarée du reste)"""
+    return (sum(len(value) for value in entry.values() if isinstance(value, (str, bytes)))
+            + entry.get(RETAINED_BYTES_FIELD, 0))
+
+
+class JobStore(MutableMapping):
+    """Dictionnaire de statuts de tâches avec TTL, plafond et éviction LRU"""
+
+    def __init__(self, ttl=JOB_TTL, max_entries=JOB_MAX_ENTRIES, max_bytes=JOB_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self.expirations = 0
+        self._data = OrderedDict()  # clé -> (entrée, dernier accès)
+        self._lock = threading.RLock()
+
+    def _is_active(self, entry):
+        return entry.get('status') in ACTIVE_STATUSES
+
+    def _expired(self, entry, touched, now):
+        return not self._is_active(entry) and now - touched > self.ttl
+
+    def prune(self):
+        """Supprime les entrées expirées puis évince en LRU au-delà des limites"""
+        with self._lock:
+            now = time.monotonic()
+            for key in [k for k, (entry, touched) in self._data.items() if self._expired(entry, touched, now)]:
+                del self._data[key]
+                self.expirations += 1
+
+            total = sum(_entry_size(entry) for entry, _ in self._data.values())
+            # Parcourir du moins récent au plus récent
+            for key in list(self._data.keys()):
+                if len(self._data) <= self.max_entries and total <= self.max_bytes:
+                    break
+                entry, _ = self._data[key]
+                if self._is_active(entry):
+                    continue
+                total -= _entry_size(entry)
+                del self._data[key]
+                self.evictions += 1
+
+    def update_job(self, key, **fields):
+        """Met à jour des champs d'une tâche existante"""
+        with self._lock:
+            self[key].update(fields)
+            if PAYLOAD_FIELD in fields:
+                self.prune()
+
+    def claim(self, key, entry):
+        """Crée la tâche key, sauf si une tâche active existe déjà pour cette clé
+
+        Retourne None si entry a été enregistrée ; sinon la requête est
+        rattachée à la tâche active (compteur 'requests' incrémenté) et une
+        copie de celle-ci, sans le résultat, est retournée.
+        """
+        with self._lock:
+            if key in self:
+                current = self[key]
+                if self._is_active(current):
+                    current['requests'] = current.get('requests', 1) + 1
+                    return {k: v for k, v in current.items() if k != PAYLOAD_FIELD}
+            self[key] = entry
+            return None
+
+    def peek(self, key):
+        """Retourne une copie de la tâche sans le résultat volumineux (None si inconnue)"""
+        with self._lock:
+            if key not in self:
+                return None
+            return {k: v for k, v in self[key].items() if k != PAYLOAD_FIELD}
+
+    def __getitem__(self, key):
+        with self._lock:
+            entry, touched = self._data[key]
+            now = time.monotonic()
+            if self._expired(entry, touched, now):
+                del self._data[key]
+                self.expirations += 1
+                raise KeyError(key)
+            self._data[key] = (entry, now)
+            self._data.move_to_end(key)
+            return entry
+
+    def __setitem__(self, key, entry):
+        with self._lock:
+            self._data[key] = (entry, time.monotonic())
+            self._data.move_to_end(key)
+            self.prune()
+
+    def __delitem__(self, key):
+        with self._lock:
+            del self._data[key]
+
+    def __contains__(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return False
+            return not self._expired(item[0], item[1], time.monotonic())
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data.keys()))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def stats(self):
+        """Retourne le nombre d'entrées, la taille stockée et les compteurs d'éviction"""
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': sum(_entry_size(entry) for entry, _ in self._data.values()),
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    key TEXT PRIMARY KEY,
+    status TEXT,
+    data TEXT NOT NULL,
+    payload TEXT,
+    size INTEGER NOT NULL DEFAULT 0,
+    accessed_at REAL NOT NULL,
+    owner TEXT
+);
+CREATE TABLE IF NOT EXISTS job_counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS job_owners (
+    owner TEXT PRIMARY KEY,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+class SqliteJobStore(MutableMapping):
+    """Registre de tâches partagé entre processus via un fichier SQLite
+
+    Même interface et mêmes règles de TTL/éviction que JobStore, mais les
+    entrées lues sont des copies : les modifications passent par update_job.
+    Le fichier survit aux processus : chaque tâche enregistre le processus
+    qui l'a écrite en dernier, et celles d'un processus disparu sont
+    traitées comme interrompues (voir JOB_OWNER_TIMEOUT).
+    """
+
+    def __init__(self, path=JOB_STORE_PATH, ttl=JOB_TTL, max_entries=JOB_MAX_ENTRIES, max_bytes=JOB_MAX_BYTES,
+                 owner_timeout=JOB_OWNER_TIMEOUT, heartbeat_interval=JOB_HEARTBEAT_INTERVAL):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.owner_timeout = owner_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self._owner_id = None
+        self._owner_pid = None
+        self._owner_lock = threading.Lock()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executescript(SQLITE_SCHEMA)
+                columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+                if 'owner' not in columns:
+                    # Fichier créé par une version précédente : ses tâches actives sont orphelines
+                    conn.execute('ALTER TABLE jobs ADD COLUMN owner TEXT')
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def _run(self, func, write=True):
+        # Transaction exclusive en écriture : les lectures-modifications sont atomiques
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+            try:
+                result = func(conn)
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            return result
+        finally:
+            conn.close()
+
+    def _owner(self):
+        """Identifiant du processus courant (son battement de cœur démarre au premier appel)"""
+        with self._owner_lock:
+            if self._owner_pid != os.getpid():
+                # Nouveau processus (y compris après un fork) : nouvel identifiant
+                self._owner_pid = os.getpid()
+                self._owner_id = f'{socket.gethostname()}:{self._owner_pid}:{uuid.uuid4().hex[:8]}'
+                threading.Thread(target=self._heartbeat, args=(self._owner_id,), daemon=True).start()
+            return self._owner_id
+
+    def _beat(self, conn, owner):
+        conn.execute('INSERT OR REPLACE INTO job_owners (owner, heartbeat) VALUES (?, ?)', (owner, time.time()))
+
+    def _heartbeat(self, owner):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self._run(lambda conn: self._beat(conn, owner))
+            except sqlite3.Error:
+                # Réessayé au prochain battement
+                pass
+
+    def _dead_clause(self):
+        """Tâche active dont le processus ne se signale plus"""
+        placeholders = ','.join('?' * len(ACTIVE_STATUSES))
+        return (f"status IN ({placeholders}) AND (owner IS NULL OR owner NOT IN "
+                f"(SELECT owner FROM job_owners WHERE heartbeat >= ?))",
+                (*ACTIVE_STATUSES, time.time() - self.owner_timeout))
+
+    def _evictable_clause(self):
+        placeholders = ','.join('?' * len(ACTIVE_STATUSES))
+        dead, params = self._dead_clause()
+        return f"(status NOT IN ({placeholders}) OR ({dead}))", (*ACTIVE_STATUSES, *params)
+
+    def _expired_clause(self):
+        evictable, params = self._evictable_clause()
+        return f"{evictable} AND accessed_at < ?", (*params, time.time() - self.ttl)
+
+    def _bump(self, conn, name, amount):
+        conn.execute(
+            'INSERT INTO job_counters (name, value) VALUES (?, ?) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value', (name, amount)
+        )
+
+    def _prune(self, conn):
+        clause, params = self._expired_clause()
+        expired = conn.execute(f'DELETE FROM jobs WHERE {clause}', params).rowcount
+        if expired:
+            self._bump(conn, 'expirations', expired)
+        conn.execute('DELETE FROM job_owners WHERE heartbeat < ?', (time.time() - max(self.ttl, self.owner_timeout),))
+        entries, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM jobs').fetchone()
+        if entries <= self.max_entries and total <= self.max_bytes:
+            return
+        evictable, params = self._evictable_clause()
+        rows = conn.execute(f'SELECT key, size FROM jobs WHERE {evictable} ORDER BY accessed_at', params).fetchall()
+        evicted = 0
+        for key, size in rows:
+            if entries <= self.max_entries and total <= self.max_bytes:
+                break
+            conn.execute('DELETE FROM jobs WHERE key = ?', (key,))
+            entries -= 1
+            total -= size
+            evicted += 1
+        if evicted:
+            self._bump(conn, 'evictions', evicted)
+
+    def prune(self):
+        """Supprime les entrées expirées puis évince en LRU au-delà des limites"""
+        self._run(self._prune)
+
+    def _write(self, conn, key, entry):
+        data = {k: v for k, v in entry.items() if k != PAYLOAD_FIELD}
+        payload = entry.get(PAYLOAD_FIELD)
+        owner = self._owner()
+        self._beat(conn, owner)
+        conn.execute(
+            'INSERT OR REPLACE INTO jobs (key, status, data, payload, size, accessed_at, owner) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, entry.get('status'), json.dumps(data), payload, _entry_size(entry), time.time(), owner)
+        )
+
+    def _read(self, conn, key, with_payload):
+        columns = 'data, payload' if with_payload else 'data, NULL'
+        expired, params = self._expired_clause()
+        dead, dead_params = self._dead_clause()
+        row = conn.execute(f'SELECT {columns}, {dead} FROM jobs WHERE key = ? AND NOT ({expired})',
+                           (*dead_params, key, *params)).fetchone()
+        if row is None:
+            return None
+        entry = json.loads(row[0])
+        if row[1] is not None:
+            entry[PAYLOAD_FIELD] = row[1]
+        if row[2]:
+            entry['status'] = 'error'
+            entry['error'] = INTERRUPTED_ERROR
+        return entry
+
+    def _touch(self, conn, key):
+        conn.execute('UPDATE jobs SET accessed_at = ? WHERE key = ?', (time.time(), key))
+
+    def update_job(self, key, **fields):
+        """Met à jour des champs d'une tâche existante"""
+        def apply(conn):
+            entry = self._read(conn, key, with_payload=True)
+            if entry is None:
+                raise KeyError(key)
+            entry.update(fields)
+            self._write(conn, key, entry)
+            if PAYLOAD_FIELD in fields:
+                self._prune(conn)
+        self._run(apply)
+
+    def claim(self, key, entry):
+        """Crée la tâche key, sauf si une tâche active existe déjà pour cette clé
+
+        Retourne None si entry a été enregistrée ; sinon la requête est
+        rattachée à la tâche active (compteur 'requests' incrémenté) et une
+        copie de celle-ci, sans le résultat, est retournée. La vérification
+        et l'écriture se font dans une même transaction : deux workers ne
+        peuvent pas lancer la même tâche.
+        """
+        def apply(conn):
+            current = self._read(conn, key, with_payload=False)
+            if current is not None and current.get('status') in ACTIVE_STATUSES:
+                current['requests'] = current.get('requests', 1) + 1
+                conn.execute('UPDATE jobs SET data = ?, accessed_at = ? WHERE key = ?',
+                             (json.dumps(current), time.time(), key))
+                return current
+            self._write(conn, key, entry)
+            self._prune(conn)
+            return None
+        return self._run(apply)
+
+    def _get(self, key, with_payload):
+        # Une lecture compte comme un accès (TTL), comme dans JobStore
+        def read(conn):
+            entry = self._read(conn, key, with_payload)
+            if entry is not None:
+                self._touch(conn, key)
+            return entry
+        return self._run(read)
+
+    def peek(self, key):
+        """Retourne une copie de la tâche sans le résultat volumineux (None si inconnue)"""
+        return self._get(key, with_payload=False)
+
+    def __getitem__(self, key):
+        entry = self._get(key, with_payload=True)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __setitem__(self, key, entry):
+        def write(conn):
+            self._write(conn, key, entry)
+            self._prune(conn)
+        self._run(write)
+
+    def __delitem__(self, key):
+        deleted = self._run(lambda conn: conn.execute('DELETE FROM jobs WHERE key = ?', (key,)).rowcount)
+        if not deleted:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self._run(lambda conn: self._read(conn, key, with_payload=False), write=False) is not None
+
+    def __iter__(self):
+        return iter([row[0] for row in self._run(lambda conn: conn.execute('SELECT key FROM jobs').fetchall(), write=False)])
+
+    def __len__(self):
+        return self._run(lambda conn: conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0], write=False)
+
+    def stats(self):
+        """Retourne le nombre d'entrées, la taille stockée et les compteurs d'éviction"""
+        def read(conn):
+            entries, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM jobs').fetchone()
+            counters = dict(conn.execute('SELECT name, value FROM job_counters').fetchall())
+            return {
+                'entries': entries,
+                'bytes': total,
+                'evictions': counters.get('evictions', 0),
+                'expirations': counters.get('expirations', 0)
+            }
+        return self._run(read, write=False)
+
+
+def make_job_store(backend=JOB_STORE_BACKEND):
+    """Crée le registre de tâches correspondant au backend configuré"""
+    if backend == 'sqlite':
+        return SqliteJobStore()
+    if backend == 'memory':
+        return JobStore()
+    raise ValueError(f"Backend de registre inconnu: {backend}")
@@ -0,0 +1,214 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Métriques au format texte Prometheus (exposées par /metrics)
+# Compteurs, jauges et histogrammes minimaux, sans dépendance externe. Chaque
+# observation ne coûte qu'un verrou et une recherche dichotomique : les
+# mesures sont prises par page ou par étape, jamais par NFT.
+# Les valeurs sont propres au processus : avec plusieurs workers gunicorn,
+# chaque worker expose ses propres séries.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Bornes par défaut des histogrammes de durée (secondes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        # Valeurs calculées à chaque lecture de /metrics (None : valeurs tenues par le module)
+        self.callback = callback
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, label_values):
+        if len(label_values) != len(self.labels):
+            raise ValueError(f"{self.name}: labels attendus {self.labels}")
+        return tuple(str(v) for v in label_values)
+
+    def _collect(self):
+        # callback retourne une valeur, ou un dict {valeurs de labels: valeur}
+        values = self.callback()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in values.items():
+            if not isinstance(label_values, tuple):
+                label_values = (label_values,)
+            key = self._key(label_values)
+            with self._lock:
+                self._values[key] = value
+
+    def render(self):
+        if self.callback is not None:
+            self._collect()
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._render_series(key, value))
+        return lines
+
+    def _render_series(self, key, value):
+        return [f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}']
+
+
+class Counter(_Metric):
+    """Compteur croissant (incrémenté directement ou lu à chaque rendu)"""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *label_values):
+        with self._lock:
+            return self._values.get(self._key(label_values), 0)
+
+
+class Gauge(_Metric):
+    """Valeur instantanée (fixée directement ou calculée à la lecture)"""
+
+    kind = 'gauge'
+
+    def set(self, value, *label_values):
+        key = self._key(label_values)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """Distribution de durées (ou de tailles) par intervalles cumulés"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *label_values):
+        key = self._key(label_values)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                # [compteurs par intervalle (+Inf en dernier), somme, nombre]
+                series = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        """Mesure la durée du bloc"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def summary(self, *label_values):
+        """Retourne (somme, nombre) d'une série"""
+        with self._lock:
+            series = self._values.get(self._key(label_values))
+            return (series[1], series[2]) if series else (0.0, 0)
+
+    def _render_series(self, key, series):
+        counts, total, count = series[0][:], series[1], series[2]
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            labels = _format_labels(self.labels, key, ('le', _format_value(float(bound))))
+            lines.append(f'{self.name}_bucket{labels} {cumulative}')
+        labels = _format_labels(self.labels, key)
+        lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+        lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class Registry:
+    """Ensemble de métriques rendues ensemble par /metrics"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                # Plusieurs versions de l'application peuvent importer ce module
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labels=(), callback=None):
+        counter = self._register(Counter(name, help_text, labels))
+        if callback is not None:
+            counter.callback = callback
+        return counter
+
+    def gauge(self, name, help_text, labels=(), callback=None):
+        gauge = self._register(Gauge(name, help_text, labels))
+        if callback is not None:
+            gauge.callback = callback
+        return gauge
+
+    def histogram(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        """Texte d'exposition Prometheus de toutes les métriques"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Métriques partagées (client ImmutableX et étapes de traitement)
+IMX_REQUESTS = REGISTRY.counter('imx_requests_total', "Requêtes envoyées à l'API ImmutableX", ('status',))
+IMX_REQUEST_SECONDS = REGISTRY.histogram('imx_request_seconds', "Latence des requêtes ImmutableX (corps inclus)")
+IMX_BYTES = REGISTRY.counter('imx_bytes_total', "Octets reçus de l'API ImmutableX", ('encoding',))
+IMX_RATE_WAIT_SECONDS = REGISTRY.counter('imx_rate_limit_wait_seconds_total', "Temps passé à attendre le limiteur de débit")
+IMX_DECODE_SECONDS = REGISTRY.histogram('imx_decode_seconds', "Durée du décodage JSON d'une page", ('decoder',),
+                                        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+STAGE_SECONDS = REGISTRY.histogram('stage_seconds', "Durée des étapes d'un export", ('stage',))
+FETCH_RESUMES = REGISTRY.counter('fetch_resumes_total', "Synchronisations reprises à leurs points de reprise")
+JOBS_DEDUPLICATED = REGISTRY.counter('jobs_deduplicated_total', "Requêtes rattachées à une tâche déjà en cours", ('route',))
+CACHE_LOOKUPS = REGISTRY.counter('cache_lookups_total', "Consultations des caches", ('cache', 'result'))
+
+
+def render():
+    """Texte d'exposition Prometheus du registre par défaut"""
+    return REGISTRY.render()
@@ -0,0 +1,206 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from asset_store import SYNC_MARGIN, _utc_iso
+from query_plan import CTA_COLLECTION
+from records import CardRecord
+
+# Index local (SQLite) des propriétaires de toute la collection CTA
+# Construit hors ligne par owner_indexer.py : un parcours complet de la
+# collection (sans filtre user), puis des balayages incrémentaux
+# (updated_min_timestamp) qui reprennent les NFTs transférés, retirés vers
+# Ethereum ou brûlés depuis le balayage précédent. Chaque NFT est gardé
+# avec son propriétaire, son statut et les champs lus par process_assets :
+# un export pour n'importe quel wallet devient une lecture locale.
+# L'application ne lit l'index que s'il a été rafraîchi il y a moins de
+# OWNER_INDEX_MAX_AGE secondes ; sinon elle revient à la récupération
+# auprès d'ImmutableX. Elle ne crée jamais le fichier.
+# Comme asset_store, un parcours interrompu reprend à ses points de reprise.
+
+OWNER_INDEX_PATH = os.environ.get('OWNER_INDEX_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'owners.db'))
+OWNER_INDEX_MAX_AGE = int(os.environ.get('OWNER_INDEX_MAX_AGE', '900'))
+
+# Statut des NFTs présents sur ImmutableX (les seuls comptés dans un rapport)
+ACTIVE_STATUS = 'imx'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tokens (
+    token_id TEXT PRIMARY KEY,
+    owner TEXT,
+    status TEXT,
+    name TEXT,
+    rarity TEXT,
+    element TEXT,
+    advancement TEXT,
+    faction TEXT,
+    grade TEXT,
+    is_foil INTEGER,
+    updated_at TEXT,
+    seen_at REAL
+);
+CREATE INDEX IF NOT EXISTS tokens_owner ON tokens (owner, status);
+CREATE TABLE IF NOT EXISTS index_state (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS crawl_checkpoints (
+    chain TEXT PRIMARY KEY,
+    cursor TEXT,
+    pages INTEGER NOT NULL,
+    done INTEGER NOT NULL
+);
+"""
+
+
+class OwnerIndex:
+    """Index SQLite propriétaire -> NFTs d'une collection, rafraîchi par balayages incrémentaux"""
+
+    def __init__(self, path=OWNER_INDEX_PATH, max_age=OWNER_INDEX_MAX_AGE, collection=CTA_COLLECTION):
+        self.path = path
+        self.max_age = max_age
+        self.collection = collection.lower()
+        with self._transaction() as conn:
+            conn.executescript(SCHEMA)
+            conn.execute("INSERT OR IGNORE INTO index_state (key, value) VALUES ('collection', ?)", (self.collection,))
+            indexed = conn.execute("SELECT value FROM index_state WHERE key = 'collection'").fetchone()[0]
+        if indexed != self.collection:
+            raise ValueError(f"{path} indexe la collection {indexed}, pas {self.collection}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+        # Une connexion par opération : l'index est partagé entre threads
+        conn = self._connect()
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _state(self, conn, key):
+        row = conn.execute('SELECT value FROM index_state WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, conn, **values):
+        conn.executemany('INSERT OR REPLACE INTO index_state (key, value) VALUES (?, ?)', values.items())
+
+    def begin_crawl(self, full=False):
+        """Prépare un parcours, ou reprend celui qui a été interrompu
+
+        Retourne (since, full, started) comme AssetStore.begin_sync : since
+        vaut None pour un parcours complet, forcé tant qu'aucun n'a abouti.
+        """
+        started = time.time()
+        with self._transaction() as conn:
+            pending_started = self._state(conn, 'pending_started')
+            if pending_started is not None and (not full or self._state(conn, 'pending_full')):
+                return self._state(conn, 'pending_since'), bool(self._state(conn, 'pending_full')), pending_started
+
+            since = self._state(conn, 'last_since')
+            full = full or since is None
+            if full:
+                since = None
+            conn.execute('DELETE FROM crawl_checkpoints')
+            self._set_state(conn, pending_since=since, pending_full=int(full), pending_started=started)
+        return since, full, started
+
+    def checkpoints(self):
+        """Points de reprise du parcours en cours : {chaîne: (curseur, pages, terminée)}"""
+        with self._transaction() as conn:
+            rows = conn.execute('SELECT chain, cursor, pages, done FROM crawl_checkpoints').fetchall()
+        return {chain: (cursor, pages, bool(done)) for chain, cursor, pages, done in rows}
+
+    def save_checkpoint(self, chain, cursor, pages, done=False):
+        """Enregistre le curseur de la prochaine page d'une chaîne (après l'enregistrement de la page)"""
+        with self._transaction() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO crawl_checkpoints (chain, cursor, pages, done) VALUES (?, ?, ?, ?)',
+                (chain, cursor, pages, int(done))
+            )
+
+    def upsert(self, tokens, seen_at):
+        """Insère ou met à jour des NFTs : (propriétaire, statut, CardRecord avec token_id)"""
+        rows = [
+            (item.token_id, (owner or '').lower(), status, item.name, item.rarity, item.element,
+             item.advancement, item.faction, item.grade, int(bool(item.is_foil)), item.updated_at, seen_at)
+            for owner, status, item in tokens
+        ]
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO tokens (token_id, owner, status, name, rarity, element, advancement, '
+                'faction, grade, is_foil, updated_at, seen_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+
+    def finish_crawl(self, started, full):
+        """Enregistre un parcours réussi : l'index est frais à la date started
+
+        Après un parcours complet (limité aux NFTs actifs), les NFTs non revus
+        sont supprimés.
+        """
+        since = _utc_iso(datetime.fromtimestamp(started, timezone.utc) - SYNC_MARGIN)
+        with self._transaction() as conn:
+            if full:
+                conn.execute('DELETE FROM tokens WHERE seen_at < ?', (started,))
+                self._set_state(conn, last_full=started)
+            self._set_state(conn, last_since=since, last_refresh=started,
+                            pending_since=None, pending_full=None, pending_started=None)
+            conn.execute('DELETE FROM crawl_checkpoints')
+
+    def age(self):
+        """Secondes écoulées depuis le début du dernier parcours réussi (None si jamais construit)"""
+        with self._transaction() as conn:
+            if self._state(conn, 'last_full') is None:
+                return None
+            return time.time() - self._state(conn, 'last_refresh')
+
+    def is_fresh(self):
+        age = self.age()
+        return age is not None and age <= self.max_age
+
+    def covers(self, collection):
+        return collection == self.collection
+
+    def iter_owner(self, owner):
+        """Parcourt les NFTs actifs d'un propriétaire au format de process_assets"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                'SELECT name, rarity, element, advancement, faction, grade, is_foil, token_id, updated_at '
+                'FROM tokens WHERE owner = ? AND status = ?', (owner.lower(), ACTIVE_STATUS)
+            )
+            for name, rarity, element, advancement, faction, grade, is_foil, token_id, updated_at in cursor:
+                yield CardRecord(name, rarity, element, advancement, faction, grade, bool(is_foil),
+                                 token_id=token_id, updated_at=updated_at)
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._transaction() as conn:
+            tokens, owners = conn.execute(
+                'SELECT COUNT(*), COUNT(DISTINCT owner) FROM tokens WHERE status = ?', (ACTIVE_STATUS,)
+            ).fetchone()
+        return {'tokens': tokens, 'owners': owners, 'age': self.age()}
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_owner_index():
+    """Retourne l'index du processus, ou None tant que OWNER_INDEX_PATH n'a pas été construit"""
+    global _index
+    with _index_lock:
+        if _index is None:
+            if not os.path.exists(OWNER_INDEX_PATH):
+                return None
+            _index = OwnerIndex()
+        return _index
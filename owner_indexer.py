@@ -0,0 +1,110 @@
+"""Indexeur hors ligne des propriétaires de la collection CTA (voir owner_index)
+
+Le premier parcours liste tous les NFTs actifs (status=imx) de la collection
+sur une seule chaîne de curseurs : des partitions par rareté ne verraient pas
+les NFTs d'une rareté absente de RARITIES, et l'index donnerait alors un
+autre résultat que la récupération en direct. Les parcours suivants ne
+demandent que les NFTs modifiés depuis le précédent (updated_min_timestamp),
+sans filtre de statut pour voir aussi les retraits et les NFTs brûlés.
+Toutes les requêtes passent par le client ImmutableX et le limiteur de débit
+du processus. Un parcours interrompu reprend à ses points de reprise.
+
+Avec --watch, un balayage est lancé toutes les N secondes : N doit rester
+inférieur à OWNER_INDEX_MAX_AGE pour que l'application continue de servir
+les exports depuis l'index.
+
+Usage : python owner_indexer.py [--full] [--watch 300]
+"""
+import argparse
+import sys
+import time
+
+import app
+from owner_index import OwnerIndex
+from query_plan import ReportQuery
+
+# Point de reprise de la chaîne unique d'un balayage incrémental
+SWEEP_CHAIN = 'sweep'
+
+# Fréquence des messages de progression (pages)
+LOG_EVERY_PAGES = 100
+
+
+def crawl(index, full=False, log=print):
+    """Parcours complet (ou balayage incrémental) de la collection ; retourne (NFTs vus, pages lues, complet)"""
+    since, full, started = index.begin_crawl(full)
+    checkpoints = index.checkpoints()
+    if checkpoints:
+        log(f"Reprise du parcours ({sum(pages for _, pages, _ in checkpoints.values())} page(s) déjà enregistrée(s))")
+    query = ReportQuery(collection=index.collection)
+    progress = {'tokens': 0, 'pages': 0}
+
+    def on_page(batch):
+        owners = {asset.get('token_id'): (asset.get('user'), asset.get('status')) for asset in batch}
+        index.upsert([(*owners[record.token_id], record) for record in app.process_assets(batch)], started)
+        progress['tokens'] += len(batch)
+        progress['pages'] += 1
+        if progress['pages'] % LOG_EVERY_PAGES == 0:
+            log(f"{progress['pages']} page(s), {progress['tokens']} NFT(s)")
+
+    def walk(chain, api_params):
+        cursor, pages_done, done = checkpoints.get(chain, (None, 0, False))
+        if done:
+            return 0
+
+        def on_checkpoint(next_cursor, pages):
+            index.save_checkpoint(chain, next_cursor, pages_done + pages, done=not next_cursor)
+        pages, _, _ = app.walk_cursor_chain(None, api_params, since, on_page, cursor, on_checkpoint=on_checkpoint)
+        return pages
+
+    if full:
+        pages = walk(app.MAIN_CHAIN, query.api_params())
+    else:
+        api_params = query.api_params()
+        # Un NFT retiré vers Ethereum ou brûlé doit quitter l'index : tous les statuts
+        del api_params['status']
+        pages = walk(SWEEP_CHAIN, api_params)
+
+    index.finish_crawl(started, full)
+    app.save_card_catalog()
+    return progress['tokens'], pages, full
+
+
+def run_once(index, full, log=print):
+    started = time.monotonic()
+    tokens, pages, full = crawl(index, full, log)
+    stats = index.stats()
+    log(f"Parcours {'complet' if full else 'incrémental'} : {tokens} NFT(s) lu(s) en {pages} page(s) "
+        f"et {time.monotonic() - started:.1f} s ; index : {stats['tokens']} NFT(s), "
+        f"{stats['owners']} propriétaire(s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construit et rafraîchit l'index des propriétaires de la collection CTA")
+    parser.add_argument('--full', action='store_true', help="Reconstruire l'index par un parcours complet")
+    parser.add_argument('--watch', type=float, default=None, metavar='SECONDES',
+                        help="Balayer la collection en continu à cet intervalle")
+    args = parser.parse_args()
+
+    index = OwnerIndex()
+    if args.watch is not None and args.watch >= index.max_age:
+        print(f"Attention : intervalle supérieur à OWNER_INDEX_MAX_AGE ({index.max_age} s), "
+              f"l'index sera considéré périmé entre deux balayages", file=sys.stderr)
+    try:
+        run_once(index, args.full)
+        while args.watch is not None:
+            time.sleep(args.watch)
+            try:
+                run_once(index, False)
+            except Exception as e:
+                # Le prochain balayage reprendra aux points de reprise
+                print(f"Erreur lors du balayage : {e}", file=sys.stderr)
+    except KeyboardInterrupt:
+        sys.exit(130)
+    except Exception as e:
+        print(f"Erreur lors du parcours : {e} (relancer la commande pour reprendre)", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
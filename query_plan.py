@@ -0,0 +1,108 @@
+import json
+import math
+import hashlib
+
+# Planification des requêtes ImmutableX
+# Traduit les options du rapport (collection, raretés, grades, foil) en filtres
+# côté serveur (collection, metadata, status) pour ne télécharger que les pages
+# utiles. Ce qui ne peut pas être filtré par l'API (le grade Standard n'a pas
+# d'attribut 'grade') reste filtré localement par matches().
+
+# Collection Cross The Ages
+CTA_COLLECTION = '0xa04bcac09a3ca810796c9e3deee8fdc8c9807166'
+
+PAGE_SIZE = 200
+
+RARITIES = ('MYTHIC', 'ULTRA_RARE', 'SPECIAL_RARE', 'RARE', 'UNCOMMON', 'COMMON', 'EXCLUSIVE')
+GRADES = ('Standard', 'C', 'B', 'A', 'S')
+
+
+def _split(value):
+    """Découpe une liste 'a,b, c' en tuple sans doublons"""
+    if not value:
+        return ()
+    return tuple(dict.fromkeys(part.strip() for part in value.split(',') if part.strip()))
+
+
+class ReportQuery:
+    """Options d'un rapport et filtres API correspondants"""
+
+    def __init__(self, collection=CTA_COLLECTION, rarities=(), grades=(), foil_only=False):
+        self.collection = collection.lower() if collection else ''
+        self.rarities = tuple(r.upper() for r in rarities)
+        self.grades = tuple(grades)
+        self.foil_only = bool(foil_only)
+
+        unknown = [r for r in self.rarities if r not in RARITIES]
+        if unknown:
+            raise ValueError(f"Rareté(s) inconnue(s): {', '.join(unknown)}")
+        unknown = [g for g in self.grades if g not in GRADES]
+        if unknown:
+            raise ValueError(f"Grade(s) inconnu(s): {', '.join(unknown)}")
+
+    @classmethod
+    def from_form(cls, form):
+        """Construit la requête à partir des champs d'un formulaire"""
+        return cls(
+            collection=form.get('collection', CTA_COLLECTION) or CTA_COLLECTION,
+            rarities=_split(form.get('rarities', '')),
+            grades=_split(form.get('grades', '')),
+            foil_only=form.get('foil_only', '') in ('1', 'true', 'on')
+        )
+
+    def is_default(self):
+        """Vrai pour le rapport complet de la collection CTA"""
+        return self.collection == CTA_COLLECTION and not self.rarities and not self.grades and not self.foil_only
+
+    def signature(self):
+        """Empreinte courte des options (sert de clé de tâche et d'instantané)"""
+        raw = json.dumps([self.collection, sorted(self.rarities), sorted(self.grades), self.foil_only])
+        return hashlib.sha1(raw.encode()).hexdigest()[:12]
+
+    def metadata_filter(self):
+        """Filtres de métadonnées poussés vers l'API"""
+        metadata = {}
+        if self.rarities:
+            metadata['rarity'] = list(self.rarities)
+        # Le grade Standard correspond à une absence d'attribut : impossible à filtrer côté API
+        if self.grades and 'Standard' not in self.grades:
+            metadata['grade'] = list(self.grades)
+        if self.foil_only:
+            metadata['foil'] = ['true']
+        return metadata
+
+    def api_params(self):
+        """Paramètres de requête /v1/assets (hors user, cursor et page_size)"""
+        params = {'status': 'imx'}
+        if self.collection:
+            params['collection'] = self.collection
+        metadata = self.metadata_filter()
+        if metadata:
+            params['metadata'] = json.dumps(metadata, separators=(',', ':'))
+        return params
+
+    def partitions(self):
+        """Sous-requêtes disjointes (une par rareté) de cette requête
+
+        Chaque partition a sa propre chaîne de curseurs et peut être parcourue
+        en parallèle des autres. Elles ne couvrent toute la requête que si
+        celle-ci filtre les raretés : sinon les NFTs d'une rareté absente de
+        RARITIES (ou sans rareté) ne sont dans aucune partition.
+        """
+        rarities = self.rarities or RARITIES
+        return [ReportQuery(self.collection, (rarity,), self.grades, self.foil_only) for rarity in rarities]
+
+    def matches(self, record):
+        """Filtre local résiduel appliqué à un NFT traité"""
+        if self.rarities and record.rarity not in self.rarities:
+            return False
+        if self.grades and (record.grade or 'Standard') not in self.grades:
+            return False
+        if self.foil_only and not record.is_foil:
+            return False
+        return True
+
+
+def pages_for(count, page_size=PAGE_SIZE):
+    """Nombre de pages nécessaires pour lister count NFTs"""
+    return max(1, math.ceil(count / page_size)) if count else 0
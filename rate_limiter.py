@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+
+# Limiteur de débit adaptatif (seau à jetons) pour l'API ImmutableX
+# Le débit augmente doucement tant que l'API répond normalement et diminue
+# de moitié dès qu'elle renvoie un 429 ; Retry-After et les en-têtes de quota
+# suspendent toutes les requêtes jusqu'à la date indiquée par l'API.
+
+
+def _header_number(headers, *names):
+    """Retourne la première valeur numérique trouvée parmi les en-têtes donnés"""
+    for name in names:
+        value = headers.get(name)
+        if value is None:
+            continue
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class AdaptiveRateLimiter:
+    """Seau à jetons dont le débit s'adapte aux réponses de l'API"""
+
+    def __init__(self, rate=5.0, burst=5, min_rate=0.5, max_rate=20.0, increase=0.5):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase = float(increase)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self._stats = {
+            'wait_time': 0.0,
+            'throttled': 0,
+            'acquired': 0
+        }
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def _try_acquire(self, waited):
+        """Prend un jeton si possible ; retourne None ou le délai à attendre"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now >= self._blocked_until and self._tokens >= 1:
+                self._tokens -= 1
+                self._stats['acquired'] += 1
+                self._stats['wait_time'] += waited
+                return None
+            if now < self._blocked_until:
+                return self._blocked_until - now
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """Bloque jusqu'à ce qu'une requête puisse partir, retourne le temps attendu"""
+        waited = 0.0
+        while True:
+            delay = self._try_acquire(waited)
+            if delay is None:
+                return waited
+            time.sleep(delay)
+            waited += delay
+
+    async def acquire_async(self):
+        """Version asyncio de acquire() : attend sans bloquer la boucle d'événements"""
+        waited = 0.0
+        while True:
+            delay = self._try_acquire(waited)
+            if delay is None:
+                return waited
+            await asyncio.sleep(delay)
+            waited += delay
+
+    def update(self, status_code, headers):
+        """Ajuste le débit à partir du code HTTP et des en-têtes de la réponse"""
+        with self._lock:
+            now = time.monotonic()
+            if status_code == 429:
+                self._stats['throttled'] += 1
+                self.rate = max(self.min_rate, self.rate / 2)
+                retry_after = _header_number(headers, 'Retry-After')
+                if retry_after is None:
+                    retry_after = 1 / self.rate
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+                self._tokens = 0.0
+                return
+
+            remaining = _header_number(headers, 'X-RateLimit-Remaining', 'RateLimit-Remaining')
+            if remaining is not None and remaining < 1:
+                # Quota épuisé : attendre la réinitialisation annoncée
+                reset = _header_number(headers, 'X-RateLimit-Reset', 'RateLimit-Reset')
+                if reset is not None:
+                    # Certaines API envoient un timestamp Unix plutôt qu'un délai
+                    if reset > 1e9:
+                        reset = max(0.0, reset - time.time())
+                    self._blocked_until = max(self._blocked_until, now + reset)
+                return
+
+            if status_code < 400:
+                self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def stats(self):
+        """Retourne une copie des métriques du limiteur"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['rate'] = round(self.rate, 3)
+        return stats
@@ -0,0 +1,70 @@
+import sys
+
+# Représentation compacte des NFTs traités
+# Un objet à __slots__ par NFT au lieu d'un dict : pas de dictionnaire
+# d'instance, et les chaînes de métadonnées (nom, rareté, élément...) sont
+# internées pour que les quelques centaines de valeurs distinctes soient
+# partagées par tous les NFTs au lieu d'être dupliquées.
+
+
+def intern_value(value):
+    """Interne une chaîne (les autres valeurs sont retournées telles quelles)"""
+    if type(value) is str:
+        return sys.intern(value)
+    return value
+
+
+class CardRecord:
+    """NFT traité : champs utilisés par l'agrégation et l'instantané local"""
+
+    __slots__ = ('token_id', 'updated_at', 'name', 'rarity', 'element', 'advancement', 'faction', 'grade', 'is_foil')
+
+    def __init__(self, name, rarity, element, advancement, faction, grade, is_foil, token_id='', updated_at=''):
+        self.token_id = token_id
+        self.updated_at = updated_at
+        self.name = intern_value(name)
+        self.rarity = intern_value(rarity)
+        self.element = intern_value(element)
+        self.advancement = intern_value(advancement)
+        self.faction = intern_value(faction)
+        self.grade = intern_value(grade)
+        self.is_foil = is_foil
+
+    def key(self):
+        """Clé d'agrégation (nom, rareté, élément, avancement, faction)"""
+        return (self.name, self.rarity, self.element, self.advancement, self.faction)
+
+    # Accès façon dict, pour le code qui manipulait les anciens dicts
+    def __getitem__(self, field):
+        try:
+            return getattr(self, field)
+        except AttributeError:
+            raise KeyError(field)
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+    def to_dict(self):
+        """Copie sous forme de dict (journalisation, sérialisation)"""
+        # CardRecord.__slots__ et non self.__slots__ : une sous-classe ne liste que ses propres champs
+        return {field: getattr(self, field) for field in CardRecord.__slots__}
+
+
+class FocusCardRecord(CardRecord):
+    """NFT traité de la version focus, avec les informations de collection"""
+
+    __slots__ = ('collection', 'collection_address', 'is_cta', 'token_address')
+
+    def __init__(self, name, rarity, element, advancement, faction, grade, is_foil, token_id='',
+                 token_address='', collection='', collection_address='', is_cta=False):
+        super().__init__(name, rarity, element, advancement, faction, grade, is_foil, token_id=token_id)
+        self.token_address = intern_value(token_address)
+        self.collection = intern_value(collection)
+        self.collection_address = intern_value(collection_address)
+        self.is_cta = is_cta
+
+    def to_dict(self):
+        """Copie sous forme de dict (journalisation, sérialisation)"""
+        data = super().to_dict()
+        data.update({field: getattr(self, field) for field in FocusCardRecord.__slots__})
+        return data
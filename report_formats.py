@@ -0,0 +1,134 @@
+import io
+import csv
+import json
+from collections import namedtuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow est optionnel
+    pa = None
+    ipc = None
+    pq = None
+
+import metrics
+import result_cache
+from card_catalog import COUNTER_NAMES
+
+# Formats de rapport servis par /download?format=
+# Le CSV (séparateur ';') reste le résultat de référence d'une tâche ; les
+# autres formats en sont dérivés avec les mêmes lignes dans le même ordre,
+# mais typés : compteurs en entiers, colonne 'adresses' d'un portefeuille en
+# table adresse -> nombre. JSON Lines est toujours disponible ; Parquet et
+# Arrow (fichier IPC) le sont quand pyarrow est installé. Chaque conversion
+# est faite une fois par résultat puis gardée dans le cache de result_cache.
+
+ReportFormat = namedtuple('ReportFormat', ('content_type', 'extension', 'compressible'))
+
+FORMATS = {
+    'csv': ReportFormat('text/csv; charset=utf-8', 'csv', True),
+    'jsonl': ReportFormat('application/x-ndjson; charset=utf-8', 'jsonl', True),
+    # Parquet compresse déjà ses colonnes
+    'parquet': ReportFormat('application/vnd.apache.parquet', 'parquet', False),
+    'arrow': ReportFormat('application/vnd.apache.arrow.file', 'arrow', True)
+}
+
+INTEGER_COLUMNS = frozenset(COUNTER_NAMES)
+BREAKDOWN_COLUMN = 'adresses'
+
+
+def available_formats():
+    """Formats utilisables dans ce processus"""
+    formats = ['csv', 'jsonl']
+    if pa is not None:
+        formats.extend(['parquet', 'arrow'])
+    return formats
+
+
+def variant(digest, name):
+    """Identifiant d'un résultat dans un format (base de son ETag)"""
+    return digest if name == 'csv' else f'{digest}.{name}'
+
+
+def parse_breakdown(value):
+    """'0xabc:2, 0xdef:1' -> {'0xabc': 2, '0xdef': 1}"""
+    breakdown = {}
+    for part in value.split(', '):
+        if part:
+            address, _, count = part.rpartition(':')
+            breakdown[address] = int(count)
+    return breakdown
+
+
+def read_report(payload):
+    """Relit un CSV de rapport : (colonnes, lignes de valeurs typées)"""
+    if isinstance(payload, bytes):
+        payload = payload.decode('utf-8')
+    reader = csv.reader(io.StringIO(payload), delimiter=';')
+    fieldnames = next(reader, [])
+    converters = [int if name in INTEGER_COLUMNS else parse_breakdown if name == BREAKDOWN_COLUMN else str
+                  for name in fieldnames]
+    rows = [[convert(value) for convert, value in zip(converters, row)] for row in reader]
+    return fieldnames, rows
+
+
+def to_jsonl(fieldnames, rows):
+    lines = [json.dumps(dict(zip(fieldnames, row)), ensure_ascii=False) for row in rows]
+    return ''.join(line + '\n' for line in lines).encode('utf-8')
+
+
+def to_table(fieldnames, rows):
+    """Table Arrow au schéma explicite (le même pour tous les rapports)"""
+    fields = []
+    arrays = []
+    for index, name in enumerate(fieldnames):
+        values = [row[index] for row in rows]
+        if name in INTEGER_COLUMNS:
+            field_type = pa.int64()
+        elif name == BREAKDOWN_COLUMN:
+            field_type = pa.map_(pa.string(), pa.int64())
+            values = [list(value.items()) for value in values]
+        else:
+            field_type = pa.string()
+        fields.append(pa.field(name, field_type))
+        arrays.append(pa.array(values, type=field_type))
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def to_parquet(fieldnames, rows):
+    sink = pa.BufferOutputStream()
+    pq.write_table(to_table(fieldnames, rows), sink)
+    return sink.getvalue().to_pybytes()
+
+
+def to_arrow(fieldnames, rows):
+    table = to_table(fieldnames, rows)
+    sink = pa.BufferOutputStream()
+    with ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+WRITERS = {'jsonl': to_jsonl, 'parquet': to_parquet, 'arrow': to_arrow}
+
+
+def convert(payload, name):
+    """Convertit un CSV de rapport dans le format name"""
+    if name == 'csv':
+        return payload
+    if name not in available_formats():
+        raise ValueError(f"Format non disponible: {name}")
+    fieldnames, rows = read_report(payload)
+    return WRITERS[name](fieldnames, rows)
+
+
+def convert_cached(payload, digest, name):
+    """convert() calculé une fois par résultat (digest) et par format"""
+    if name == 'csv':
+        return payload
+
+    def build():
+        with metrics.STAGE_SECONDS.time(f'convert_{name}'):
+            return convert(payload, name)
+    return result_cache.get_result_cache().get((digest, name), build, 'converted_result')
@@ -0,0 +1,184 @@
+import os
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel
+    brotli = None
+
+import metrics
+
+# Résultats servis par /download
+# Un résultat est identifié par l'empreinte SHA-256 de son contenu : elle
+# sert d'ETag fort (une valeur par encodage), de nom de fichier et de clé du
+# cache des représentations dérivées (versions compressées, autres formats
+# de report_formats). Un client qui renvoie l'ETag reçoit un 304
+# sans corps ; les autres reçoivent le résultat en brotli (si le module est
+# installé) ou en gzip selon Accept-Encoding. Chaque version compressée est
+# calculée une fois par processus puis gardée en mémoire (LRU borné par
+# RESULT_CACHE_MAX_BYTES), partagée entre toutes les tâches au contenu
+# identique.
+
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', str(64 * 1024 * 1024)))
+
+# Niveaux de compression : le calcul n'est fait qu'une fois par résultat
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# Suffixe de l'ETag de chaque encodage
+ETAG_SUFFIXES = {'identity': '', 'gzip': '.gz', 'br': '.br'}
+
+DOWNLOADS = metrics.REGISTRY.counter('downloads_total', "Réponses de /download", ('status', 'format', 'encoding'))
+
+
+def content_hash(payload):
+    """Empreinte SHA-256 (hexadécimale) d'un résultat"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def result_filename(prefix, digest, extension='csv'):
+    """Nom de fichier adressé par le contenu"""
+    return f'{prefix}_{digest[:16]}.{extension}'
+
+
+def available_encodings():
+    """Encodages proposés, du plus efficace au moins efficace"""
+    return (['br'] if brotli is not None else []) + ['gzip']
+
+
+def negotiate(accept_encoding):
+    """Encodage à utiliser pour un en-tête Accept-Encoding ('br', 'gzip' ou 'identity')"""
+    accepted = {}
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[coding] = quality
+
+    best, best_quality = 'identity', 0.0
+    for coding in available_encodings():
+        quality = accepted.get(coding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def etag(digest, encoding='identity'):
+    """ETag fort d'une représentation du résultat"""
+    return f'"{digest}{ETAG_SUFFIXES[encoding]}"'
+
+
+def not_modified(if_none_match, tag):
+    """Indique si l'en-tête If-None-Match désigne la représentation tag"""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(',')]
+    # If-None-Match se compare sans tenir compte du préfixe W/
+    return '*' in tags or tag in tags or f'W/{tag}' in tags
+
+
+def response_headers(tag, encoding, filename=None):
+    """En-têtes communs aux réponses 200 et 304 de /download"""
+    headers = {
+        'ETag': tag,
+        'Vary': 'Accept-Encoding',
+        # Conservable, mais revalidé à chaque téléchargement (un nouvel export
+        # de la même adresse peut changer le contenu)
+        'Cache-Control': 'private, no-cache'
+    }
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    if filename:
+        headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return headers
+
+
+def compress(payload, encoding):
+    if encoding == 'gzip':
+        # mtime fixe : des octets identiques pour un même contenu
+        return gzip.compress(payload, compresslevel=GZIP_LEVEL, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(payload, quality=BROTLI_QUALITY)
+    return payload
+
+
+class ResultCache:
+    """Représentations dérivées des résultats (versions compressées, autres formats), avec éviction LRU"""
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, build, cache_name):
+        """Octets en cache pour key, calculés par build() au premier accès"""
+        with self._lock:
+            body = self._data.get(key)
+            if body is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if body is not None:
+            metrics.CACHE_LOOKUPS.inc(1, cache_name, 'hit')
+            return body
+
+        metrics.CACHE_LOOKUPS.inc(1, cache_name, 'miss')
+        body = build()
+        if len(body) <= self.max_bytes:
+            with self._lock:
+                if key not in self._data:
+                    self._data[key] = body
+                    self._bytes += len(body)
+                while self._bytes > self.max_bytes:
+                    _, evicted = self._data.popitem(last=False)
+                    self._bytes -= len(evicted)
+        return body
+
+    def encode(self, payload, digest, encoding):
+        """Retourne payload dans l'encodage demandé, compressé au plus une fois"""
+        if encoding == 'identity':
+            return payload
+
+        def build():
+            with metrics.STAGE_SECONDS.time(f'compress_{encoding}'):
+                return compress(payload, encoding)
+        return self.get((digest, encoding), build, 'compressed_result')
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._data), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Retourne le cache des représentations de résultats du processus"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResultCache()
+        return _cache
+
+
+metrics.REGISTRY.gauge('result_cache_bytes', "Taille des représentations de résultats en cache",
+                       callback=lambda: get_result_cache().stats()['bytes'])
@@ -0,0 +1,45 @@
+"""Enregistrements compacts des NFTs traités (records.py)"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from records import CardRecord, FocusCardRecord
+
+
+def test_card_record_to_dict():
+    record = CardRecord('Carte 1', 'RARE', 'FIRE', 'STANDARD', 'HUMAN', 'A', True, token_id='42',
+                        updated_at='2024-01-01T00:00:00.000Z')
+    assert record.to_dict() == {
+        'token_id': '42',
+        'updated_at': '2024-01-01T00:00:00.000Z',
+        'name': 'Carte 1',
+        'rarity': 'RARE',
+        'element': 'FIRE',
+        'advancement': 'STANDARD',
+        'faction': 'HUMAN',
+        'grade': 'A',
+        'is_foil': True
+    }
+
+
+def test_focus_card_record_to_dict_keeps_base_fields():
+    # Champs de CardRecord et de FocusCardRecord (exemple de NFT journalisé par la version focus)
+    record = FocusCardRecord('Carte 2', 'COMMON', 'WATER', 'COMBO', 'SPIRIT', None, False, token_id='7',
+                             token_address='0xabc', collection='Cross The Ages', collection_address='0xabc',
+                             is_cta=True)
+    assert record.to_dict() == {
+        'token_id': '7',
+        'updated_at': '',
+        'name': 'Carte 2',
+        'rarity': 'COMMON',
+        'element': 'WATER',
+        'advancement': 'COMBO',
+        'faction': 'SPIRIT',
+        'grade': None,
+        'is_foil': False,
+        'collection': 'Cross The Ages',
+        'collection_address': '0xabc',
+        'is_cta': True,
+        'token_address': '0xabc'
+    }